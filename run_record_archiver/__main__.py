@@ -2,17 +2,20 @@ import argparse
 import locale
 import logging
 import os
+import queue
 import signal
 import sys
 import time
+from logging.handlers import QueueHandler, QueueListener
 from pathlib import Path
-from typing import Optional
+from typing import List, Optional
 from run_record_archiver.config import Config
-from run_record_archiver.constants import EXIT_CODE_SUCCESS, EXIT_CODE_ERROR, EXIT_CODE_UNEXPECTED_ERROR, EXIT_CODE_INTERRUPTED, SIGINT_IMMEDIATE_SHUTDOWN_COUNT, SIGINT_TIME_WINDOW_SECONDS, LOG_FILE_MAX_BYTES, LOG_FILE_MAX_AGE_SECONDS, LOG_FILE_BACKUP_COUNT
+from run_record_archiver.constants import EXIT_CODE_SUCCESS, EXIT_CODE_ERROR, EXIT_CODE_UNEXPECTED_ERROR, EXIT_CODE_INTERRUPTED, SIGINT_IMMEDIATE_SHUTDOWN_COUNT, SIGINT_TIME_WINDOW_SECONDS, LOG_FILE_MAX_BYTES, LOG_FILE_MAX_AGE_SECONDS, LOG_FILE_BACKUP_COUNT, LOG_FILE_SIZE_CHECK_INTERVAL
 from run_record_archiver.exceptions import ArchiverError, LockExistsError
 from run_record_archiver.log_handler import SizeAndTimeRotatingFileHandler
 from run_record_archiver.orchestrator import Orchestrator
 from run_record_archiver.persistence.lock import FileLock
+from run_record_archiver.services.reporting import shutdown_reporting
 os.environ['LANG'] = 'en_US.UTF-8'
 os.environ['LANGUAGE'] = 'en_US.UTF-8'
 os.environ['LC_ALL'] = 'en_US.UTF-8'
@@ -23,6 +26,7 @@ except locale.Error:
         locale.setlocale(locale.LC_ALL, 'C.UTF-8')
     except locale.Error:
         pass
+_log_listener: Optional[QueueListener] = None
 
 class SignalHandler:
 
@@ -46,7 +50,7 @@ class SignalHandler:
             self._logger.warning('=' * 70)
             self._logger.warning('IMMEDIATE SHUTDOWN REQUESTED (3x Ctrl-C)')
             self._logger.warning('=' * 70)
-            logging.shutdown()
+            shutdown_logging()
             os._exit(EXIT_CODE_INTERRUPTED)
         elif self.sigint_count == 1:
             self._logger.warning('=' * 70)
@@ -72,21 +76,36 @@ def setup_logging(level: str, log_file: Optional[Path], verbose: bool=False) ->
         log_level = logging.INFO
         logging.basicConfig()
         logging.warning("Invalid log level '%s', defaulting to INFO.", log_level_str)
+    global _log_listener
     root_logger = logging.getLogger()
     root_logger.setLevel(log_level)
     root_logger.handlers.clear()
     formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
     stream_handler = logging.StreamHandler(sys.stdout)
     stream_handler.setFormatter(formatter)
-    root_logger.addHandler(stream_handler)
+    handlers: List[logging.Handler] = [stream_handler]
+    file_error = None
     if log_file:
         try:
             log_file.parent.mkdir(parents=True, exist_ok=True)
-            file_handler = SizeAndTimeRotatingFileHandler(filename=str(log_file), max_bytes=LOG_FILE_MAX_BYTES, max_age_seconds=LOG_FILE_MAX_AGE_SECONDS, backup_count=LOG_FILE_BACKUP_COUNT)
+            file_handler = SizeAndTimeRotatingFileHandler(filename=str(log_file), max_bytes=LOG_FILE_MAX_BYTES, max_age_seconds=LOG_FILE_MAX_AGE_SECONDS, backup_count=LOG_FILE_BACKUP_COUNT, size_check_interval=LOG_FILE_SIZE_CHECK_INTERVAL)
             file_handler.setFormatter(formatter)
-            root_logger.addHandler(file_handler)
+            handlers.append(file_handler)
         except (IOError, PermissionError) as e:
-            root_logger.error("Failed to configure file logging at '%s': %s", log_file, e)
+            file_error = e
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    root_logger.addHandler(QueueHandler(log_queue))
+    _log_listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _log_listener.start()
+    if file_error is not None:
+        root_logger.error("Failed to configure file logging at '%s': %s", log_file, file_error)
+
+def shutdown_logging() -> None:
+    global _log_listener
+    if _log_listener is not None:
+        _log_listener.stop()
+        _log_listener = None
+    logging.shutdown()
 
 def main() -> None:
     help_flags = ['-h', '--help', '/?', '/h', '/help']
@@ -194,7 +213,10 @@ def main() -> None:
                     logger.info('Check logs for details about %s stage failure.', error_stage)
             else:
                 logger.info('Archiver execution complete.')
-        logging.shutdown()
+        if sig_handler.orchestrator:
+            sig_handler.orchestrator.close()
+        shutdown_reporting()
+        shutdown_logging()
         os._exit(exit_code)
 if __name__ == '__main__':
     main()
\ No newline at end of file
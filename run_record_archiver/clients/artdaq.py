@@ -69,7 +69,7 @@ class ArtdaqDBClient:
         entity_userdata_map['hashes'] = '\n'.join(hashes)
 
     @performance_monitor
-    def get_archived_runs(self) -> Set[int]:
+    def get_archived_runs(self, min_run: Optional[int]=None) -> Set[int]:
         original_uri = self.database_uri
         try:
             os.environ['ARTDAQ_DATABASE_URI'] = self.database_uri
@@ -81,7 +81,8 @@ class ArtdaqDBClient:
             if not success:
                 raise ArtdaqDBError(f'Failed to get configurations: {result_json}')
             configs = json.loads(result_json)['search']
-            return {int(match.group(1)) for config in configs if (match := re.match('^\\s*(\\d+)/', config.get('name', '')))}
+            runs = (int(match.group(1)) for config in configs if (match := re.match('^\\s*(\\d+)/', config.get('name', ''))))
+            return {run for run in runs if min_run is None or run >= min_run}
         except (json.JSONDecodeError, KeyError) as e:
             raise ArtdaqDBError(f'Failed to parse configurations list: {e}') from e
         finally:
@@ -1,7 +1,9 @@
 import logging
 import socket
+import threading
 import time
-from typing import Optional
+from typing import List, Optional, Tuple
+from ..constants import CARBON_FLUSH_INTERVAL_SECONDS, CARBON_MAX_BATCH_METRICS
 
 class CarbonClient:
 
@@ -16,16 +18,70 @@ class CarbonClient:
             self.enabled = False
 
     def post_metric(self, metric_path: str, value: float, timestamp: Optional[float]=None) -> None:
-        if not self.enabled:
+        self.post_metrics([(metric_path, value)], timestamp)
+
+    def post_metrics(self, metrics: List[Tuple[str, float]], timestamp: Optional[float]=None) -> None:
+        if not self.enabled or not metrics:
             return
-        ts = int(timestamp if timestamp is not None else time.time())
-        full_metric_path = f'{self.metric_prefix}.{metric_path}'
-        message = f'{full_metric_path} {value} {ts}\n'.encode('utf-8')
+        ts = timestamp if timestamp is not None else time.time()
+        self._send([(metric_path, value, ts) for (metric_path, value) in metrics])
+
+    def _send(self, metrics: List[Tuple[str, float, float]]) -> None:
+        message = ''.join((f'{self.metric_prefix}.{metric_path} {value} {int(ts)}\n' for (metric_path, value, ts) in metrics)).encode('utf-8')
         try:
             with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
                 sock.settimeout(2.0)
                 sock.connect((self.host, self.port))
                 sock.sendall(message)
-            self._logger.debug('Posted metric to Carbon: %s', message.strip().decode())
+            self._logger.debug('Posted %d metric(s) to Carbon: %s', len(metrics), message.strip().decode())
         except (socket.error, socket.timeout) as e:
-            self._logger.warning("Could not post metric '%s' to Carbon at %s:%d. Reason: %s", full_metric_path, self.host, self.port, e)
\ No newline at end of file
+            self._logger.warning("Could not post metric(s) '%s' to Carbon at %s:%d. Reason: %s", ', '.join((metric_path for (metric_path, _, _) in metrics)), self.host, self.port, e)
+
+class BatchingCarbonClient(CarbonClient):
+
+    def __init__(self, host: Optional[str]=None, port: Optional[int]=None, metric_prefix: Optional[str]=None, enabled: bool=False, flush_interval: float=CARBON_FLUSH_INTERVAL_SECONDS, max_batch: int=CARBON_MAX_BATCH_METRICS):
+        super().__init__(host=host, port=port, metric_prefix=metric_prefix, enabled=enabled)
+        self._flush_interval = flush_interval
+        self._max_batch = max_batch
+        self._buffer: List[Tuple[str, float, float]] = []
+        self._buffer_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._closed = False
+        self._flusher: Optional[threading.Thread] = None
+
+    def post_metrics(self, metrics: List[Tuple[str, float]], timestamp: Optional[float]=None) -> None:
+        if not self.enabled or not metrics:
+            return
+        ts = timestamp if timestamp is not None else time.time()
+        with self._buffer_lock:
+            closed = self._closed
+            if not closed and self._flusher is None:
+                self._flusher = threading.Thread(target=self._flush_loop, name='CarbonFlusher', daemon=True)
+                self._flusher.start()
+            self._buffer.extend(((metric_path, value, ts) for (metric_path, value) in metrics))
+            full = len(self._buffer) >= self._max_batch
+        if closed:
+            self.flush()
+        elif full:
+            self._wakeup.set()
+
+    def _flush_loop(self) -> None:
+        while not self._closed:
+            self._wakeup.wait(self._flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def flush(self) -> None:
+        with self._buffer_lock:
+            (batch, self._buffer) = (self._buffer, [])
+        if batch:
+            self._send(batch)
+
+    def close(self) -> None:
+        with self._buffer_lock:
+            self._closed = True
+            flusher = self._flusher
+        self._wakeup.set()
+        if flusher is not None:
+            flusher.join()
+        self.flush()
\ No newline at end of file
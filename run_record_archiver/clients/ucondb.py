@@ -1,12 +1,13 @@
 import logging
 import random
-from typing import Optional, Set
+from typing import Optional, Set, Union
 import urllib3
 from ucondb.webapi import UConDBClient as UConDBAPIClient
 from ..config import UconDBConfig
 from ..exceptions import UconDBError, FuzzSkipError
 from ..utils import performance_monitor
 from .carbon import CarbonClient
+urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
 class UconDBClient:
 
@@ -19,7 +20,6 @@ class UconDBClient:
         self.random_skip_retry = random_skip_retry
         self.random_error_retry = random_error_retry
         self._incremental_mode = False
-        urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
         try:
             self._logger.info('Initializing UconDB client for server: %s', config.server_url)
             self.client = UConDBAPIClient(server_url=config.server_url, timeout=config.timeout_seconds, username=config.writer_user, password=config.writer_password)
@@ -31,15 +31,16 @@ class UconDBClient:
         self._incremental_mode = incremental
 
     @performance_monitor
-    def get_existing_runs(self) -> Set[int]:
+    def get_existing_runs(self, min_run: Optional[int]=None) -> Set[int]:
         try:
             results = self.client.lookup_versions(folder_name=self._config.folder_name, object_name=self._config.object_name)
-            return {int(r['key']) for r in results if r.get('key', '').isdigit()}
+            runs = (int(r['key']) for r in results if r.get('key', '').isdigit())
+            return {run for run in runs if min_run is None or run >= min_run}
         except Exception as e:
             raise UconDBError(f'Failed to look up versions in UconDB: {e}') from e
 
     @performance_monitor
-    def upload_blob(self, run_number: int, blob_content: str) -> str:
+    def upload_blob(self, run_number: int, blob_content: Union[str, bytes]) -> str:
         if not self._incremental_mode:
             if self.random_skip_percent > 0:
                 if random.randint(1, 100) <= self.random_skip_percent:
@@ -60,7 +61,8 @@ class UconDBClient:
                             raise UconDBError(f'[FUZZ] Random test failure for run {run_number}', run_number=run_number)
         try:
             key = str(run_number)
-            version = self.client.put(folder_name=self._config.folder_name, object_name=self._config.object_name, data=blob_content, key=key, tags=key)
+            data = blob_content.decode('utf-8') if isinstance(blob_content, bytes) else blob_content
+            version = self.client.put(folder_name=self._config.folder_name, object_name=self._config.object_name, data=data, key=key, tags=key)
             if version is None:
                 raise UconDBError('UConDBClient.put returned None, indicating an upload error.')
             return version
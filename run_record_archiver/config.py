@@ -167,6 +167,11 @@ class AppConfig:
         self.parallel_workers = int(data.get('parallel_workers', 2))
         self.run_process_retries = int(data.get('run_process_retries', 2))
         self.retry_delay_seconds = int(data.get('retry_delay_seconds', 3))
+        self.trust_server_checksum = bool(data.get('trust_server_checksum', False))
+        scratch_dir = data.get('scratch_dir')
+        self.scratch_dir: Optional[Path] = Path(scratch_dir) if scratch_dir else None
+        if self.scratch_dir is not None and (not (self.scratch_dir.is_dir() and os.access(self.scratch_dir, os.W_OK | os.X_OK))):
+            raise ConfigurationError(f"App config: 'scratch_dir' '{self.scratch_dir}' is not a writable directory.")
         self.log_level = str(data.get('log_level', 'INFO')).upper()
         log_file_path = data.get('log_file')
         self.log_file: Optional[Path] = Path(log_file_path) if log_file_path else None
@@ -1,6 +1,15 @@
 DEFAULT_UCONDB_TIMEOUT_SECONDS = 30
+UCONDB_CONNECT_TIMEOUT_SECONDS = 5
+VERIFY_DOWNLOAD_CHUNK_BYTES = 64 * 1024
 EMAIL_SMTP_TIMEOUT_SECONDS = 10
+REPORTING_FLUSH_TIMEOUT_SECONDS = 30.0
 PROCESS_RUNNER_TIMEOUT_SECONDS = 300
+PROCESS_RUNNER_OUTPUT_CAPTURE_BYTES = 30000
+SSH_CONTROL_PATH = '~/.ssh/run_record_archiver-%C'
+SSH_CONTROL_PERSIST_SECONDS = 600
+SSH_MASTER_START_TIMEOUT_SECONDS = 30
+CARBON_FLUSH_INTERVAL_SECONDS = 10.0
+CARBON_MAX_BATCH_METRICS = 500
 LOCK_MONITOR_JOIN_TIMEOUT_SECONDS = 2.0
 LOCK_MONITOR_POLL_INTERVAL_SECONDS = 0.1
 DEFAULT_RUN_PROCESS_RETRIES = 2
@@ -9,7 +18,12 @@ SIGINT_TIME_WINDOW_SECONDS = 2.0
 LOG_FILE_MAX_BYTES = 500 * 1024 * 1024
 LOG_FILE_MAX_AGE_SECONDS = 14 * 24 * 60 * 60
 LOG_FILE_BACKUP_COUNT = 5
+LOG_FILE_SIZE_CHECK_INTERVAL = 64
 PROGRESS_REPORT_INTERVAL = 10
+PROGRESS_REPORTS_PER_BATCH = 20
+FAILURE_LOG_FLUSH_INTERVAL = 10
+LOCK_MONITOR_POLL_SECONDS = 1.0
+BATCH_RESULT_POLL_SECONDS = 1.0
 PREVIEW_LIST_LIMIT = 10
 EXIT_CODE_SUCCESS = 0
 EXIT_CODE_ERROR = 1
@@ -7,35 +7,45 @@ from typing import Optional
 
 class SizeAndTimeRotatingFileHandler(RotatingFileHandler):
 
-    def __init__(self, filename: str, mode: str='a', max_bytes: int=0, backup_count: int=0, encoding: Optional[str]=None, delay: bool=False, max_age_seconds: Optional[int]=None):
+    def __init__(self, filename: str, mode: str='a', max_bytes: int=0, backup_count: int=0, encoding: Optional[str]=None, delay: bool=False, max_age_seconds: Optional[int]=None, size_check_interval: int=1):
         super().__init__(filename, mode, max_bytes, backup_count, encoding, delay)
         self.max_age_seconds = max_age_seconds
+        self.size_check_interval = max(1, size_check_interval)
+        self._size_check_counter = 0
         self._log_file_created_time: Optional[float] = None
+        self._next_age_rollover: Optional[float] = None
         if os.path.exists(filename):
-            self._log_file_created_time = os.path.getctime(filename)
+            self._set_log_file_created_time(os.path.getctime(filename))
+
+    def _set_log_file_created_time(self, created_time: Optional[float]) -> None:
+        self._log_file_created_time = created_time
+        if created_time is None or self.max_age_seconds is None:
+            self._next_age_rollover = None
+        else:
+            self._next_age_rollover = time.monotonic() + (created_time + self.max_age_seconds - time.time())
 
     def shouldRollover(self, record: logging.LogRecord) -> bool:
-        if super().shouldRollover(record):
-            return True
         if self.max_age_seconds is not None:
             if self._log_file_created_time is None and os.path.exists(self.baseFilename):
-                self._log_file_created_time = os.path.getctime(self.baseFilename)
-            if self._log_file_created_time is not None:
-                current_time = time.time()
-                file_age = current_time - self._log_file_created_time
-                if file_age >= self.max_age_seconds:
-                    return True
-        return False
+                self._set_log_file_created_time(os.path.getctime(self.baseFilename))
+            if self._next_age_rollover is not None and time.monotonic() >= self._next_age_rollover:
+                return True
+        self._size_check_counter += 1
+        if self._size_check_counter < self.size_check_interval:
+            return False
+        self._size_check_counter = 0
+        return super().shouldRollover(record)
 
     def doRollover(self):
         super().doRollover()
+        self._size_check_counter = 0
         if os.path.exists(self.baseFilename):
-            self._log_file_created_time = os.path.getctime(self.baseFilename)
+            self._set_log_file_created_time(os.path.getctime(self.baseFilename))
         else:
-            self._log_file_created_time = None
+            self._set_log_file_created_time(None)
 
     def emit(self, record: logging.LogRecord):
         if self._log_file_created_time is None and self.stream is not None:
             if os.path.exists(self.baseFilename):
-                self._log_file_created_time = os.path.getctime(self.baseFilename)
+                self._set_log_file_created_time(os.path.getctime(self.baseFilename))
         super().emit(record)
\ No newline at end of file
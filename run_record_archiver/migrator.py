@@ -1,21 +1,37 @@
+import array
+import base64
+import binascii
 import hashlib
 import logging
+import os
+import queue
+import shutil
 import tempfile
+import threading
 import time
-from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
-from typing import List, Optional
-import requests
+from typing import Callable, List, NamedTuple, Optional, Tuple
 import urllib3
 from .clients.artdaq import ArtdaqDBClient
 from .clients.carbon import CarbonClient
 from .clients.ucondb import UconDBClient
 from .config import Config
-from .exceptions import ArchiverError, VerificationError, FuzzSkipError
+from .constants import BATCH_RESULT_POLL_SECONDS, DEFAULT_UCONDB_TIMEOUT_SECONDS, PROGRESS_REPORT_INTERVAL, PROGRESS_REPORTS_PER_BATCH, UCONDB_CONNECT_TIMEOUT_SECONDS, VERIFY_DOWNLOAD_CHUNK_BYTES
+from .exceptions import ArchiverError, UconDBError, VerificationError, FuzzSkipError
 from .persistence import state
 from .services.blob_creator import BlobCreator
 from .services.blob_validator import BlobValidator
 from .services.reporting import send_failure_report
+from .utils import bounded_worker_count
+urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+_WORK_SENTINEL = object()
+
+class _MigrationItem(NamedTuple):
+    run_number: int
+    attempt: int
+    blob: bytes = b''
+    md5: str = ''
+    not_before: float = 0.0
 
 class Migrator:
 
@@ -27,27 +43,30 @@ class Migrator:
         self._blob_validator = BlobValidator()
         self._carbon_client = carbon_client
         self._logger = logging.getLogger(__name__)
-        self._shutdown_check = lambda : False
-        self._validate_blobs = False
-        urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+        self._shutdown_event = threading.Event()
+        self._scratch = threading.local()
+        self._verify_one = self._stage_verify_fast
+        self._in_flight = 0
+        self._in_flight_lock = threading.Lock()
+        self._http = urllib3.PoolManager(num_pools=4, maxsize=bounded_worker_count(self._config.app.parallel_workers), cert_reqs='CERT_NONE', retries=urllib3.Retry(total=3, backoff_factor=0.5, status_forcelist=[502, 503, 504]))
 
-    def set_shutdown_check(self, shutdown_check_func):
-        self._shutdown_check = shutdown_check_func
+    def set_shutdown_event(self, shutdown_event: threading.Event) -> None:
+        self._shutdown_event = shutdown_event
 
     def _get_runs_to_migrate(self, incremental: bool) -> List[int]:
         self._logger.info('Migration Stage: Fetching runs (mode: %s).', 'incremental' if incremental else 'full')
+        min_run = None
+        if incremental:
+            last_success = state.get_incremental_start_run(self._config.app.migrate_state_file)
+            self._logger.info('Incremental mode: filtering runs > %d', last_success)
+            min_run = last_success + 1
         self._logger.info('Querying ArtdaqDB for available runs...')
-        artdaq_runs = self._artdaq.get_archived_runs()
+        artdaq_runs = self._artdaq.get_archived_runs(min_run=min_run)
         self._logger.info('Found %d runs in ArtdaqDB', len(artdaq_runs))
         self._logger.info('Querying UconDB for already migrated runs...')
-        ucon_runs = self._ucon.get_existing_runs()
+        ucon_runs = self._ucon.get_existing_runs(min_run=min_run)
         self._logger.info('Found %d runs already in UconDB', len(ucon_runs))
-        runs_to_migrate = sorted(list(artdaq_runs - ucon_runs))
-        self._logger.debug('Candidate runs before filtering: %s', runs_to_migrate[:10] if len(runs_to_migrate) > 10 else runs_to_migrate)
-        if incremental:
-            last_success = state.get_incremental_start_run(self._config.app.migrate_state_file)
-            self._logger.info('Incremental mode: filtering runs > %d', last_success)
-            runs_to_migrate = [run for run in runs_to_migrate if run > last_success]
+        runs_to_migrate = sorted(artdaq_runs - ucon_runs)
         self._logger.info('Migration Stage: Found %d runs to migrate.', len(runs_to_migrate))
         if runs_to_migrate:
             self._logger.info('Run range: %d to %d', min(runs_to_migrate), max(runs_to_migrate))
@@ -59,121 +78,252 @@ class Migrator:
         obj = self._config.ucon_db.object_name
         return f'{base_url}/data/{folder}/{obj}/key={run_number}'
 
-    def _process_run(self, run_number: int) -> bool:
-        retries = self._config.app.run_process_retries
-        for attempt in range(retries + 1):
+    def _download_blob_md5(self, run_number: int, data_url: str, keep_content: bool=False) -> Tuple[str, Optional[bytes]]:
+        response = self._http.request('GET', data_url, preload_content=False, timeout=urllib3.Timeout(connect=UCONDB_CONNECT_TIMEOUT_SECONDS, read=DEFAULT_UCONDB_TIMEOUT_SECONDS))
+        try:
+            if response.status >= 400:
+                raise UconDBError(f'Verification download failed with HTTP status {response.status}', stage='Migration', run_number=run_number, context={'url': data_url})
+            hasher = hashlib.md5()
+            chunks: List[bytes] = []
+            for chunk in response.stream(VERIFY_DOWNLOAD_CHUNK_BYTES):
+                hasher.update(chunk)
+                if keep_content:
+                    chunks.append(chunk)
+        finally:
+            response.release_conn()
+        return (hasher.hexdigest(), b''.join(chunks) if keep_content else None)
+
+    def _fetch_server_md5(self, data_url: str) -> Optional[str]:
+        response = self._http.request('HEAD', data_url, timeout=urllib3.Timeout(connect=UCONDB_CONNECT_TIMEOUT_SECONDS, read=DEFAULT_UCONDB_TIMEOUT_SECONDS))
+        if response.status >= 400:
+            return None
+        content_md5 = response.headers.get('Content-MD5')
+        if content_md5:
             try:
-                self._logger.info('→ Processing run %d (attempt %d/%d)', run_number, attempt + 1, retries + 1)
-                with tempfile.TemporaryDirectory(prefix=f'migrator_{run_number}_') as tmpdir:
-                    tmpdir_path = Path(tmpdir)
-                    self._logger.debug('Run %d: Exporting from ArtdaqDB', run_number)
-                    self._artdaq.export_run_configuration(run_number, tmpdir_path)
-                    self._logger.debug('Run %d: Creating data blob', run_number)
-                    generated_blob = self._blob_creator.create_blob_from_directory(run_number, tmpdir_path)
-                    blob_size = len(generated_blob)
-                    self._logger.debug('Run %d: Generated blob size: %d bytes', run_number, blob_size)
-                    self._logger.debug('Run %d: Uploading to UconDB', run_number)
-                    self._ucon.upload_blob(run_number, generated_blob)
-                    self._logger.debug('Run %d: Upload successful', run_number)
-                    data_url = self._get_ucondb_data_url(run_number)
-                    self._logger.debug('Run %d: Verifying integrity from UconDB', run_number)
-                    response = requests.get(data_url, verify=False, timeout=30)
-                    response.raise_for_status()
-                    downloaded_blob = response.text
-                    h1 = hashlib.md5(generated_blob.encode('utf-8')).hexdigest()
-                    h2 = hashlib.md5(downloaded_blob.encode('utf-8')).hexdigest()
-                    if h1 != h2:
-                        raise VerificationError(f'MD5 mismatch between generated and downloaded blobs', stage='Migration', run_number=run_number, context={'generated_md5': h1, 'downloaded_md5': h2})
-                    self._logger.debug('Run %d: MD5 verification passed (hash: %s)', run_number, h1)
-                    if self._validate_blobs:
-                        self._logger.debug('Run %d: Validating blob metadata', run_number)
-                        (error_count, results) = self._blob_validator.validate_blob(downloaded_blob, run_number)
-                        if error_count > 0:
-                            self._logger.warning('Run %d: Blob validation found %d errors: %s', run_number, error_count, results)
-                        else:
-                            self._logger.debug('Run %d: Blob validation passed: %s', run_number, results)
-                self._logger.info('✓ Run %d migrated and verified successfully', run_number)
-                return True
-            except FuzzSkipError as e:
-                self._logger.error('✗ Run %d permanently failed (fuzz skip): %s', run_number, e)
-                return False
-            except (ArchiverError, requests.RequestException) as e:
-                self._logger.error('✗ Run %d failed (attempt %d/%d): %s', run_number, attempt + 1, retries + 1, e)
-                if attempt < retries:
-                    self._logger.info('Retrying run %d in %d seconds...', run_number, self._config.app.retry_delay_seconds)
-                    time.sleep(self._config.app.retry_delay_seconds)
-        return False
-
-    def _process_batch(self, runs: List[int]) -> tuple[List[int], List[int]]:
-        (successful, failed) = ([], [])
+                return base64.b64decode(content_md5, validate=True).hex()
+            except (binascii.Error, ValueError):
+                pass
+        etag = (response.headers.get('ETag') or '').strip().strip('"').lower()
+        if len(etag) == 32 and all((c in '0123456789abcdef' for c in etag)):
+            return etag
+        return None
+
+    def _worker_scratch_dir(self) -> Path:
+        scratch = getattr(self._scratch, 'dir', None)
+        if scratch is None:
+            scratch = tempfile.TemporaryDirectory(prefix='migrator_', dir=self._config.app.scratch_dir)
+            self._scratch.dir = scratch
+        return Path(scratch.name)
+
+    def _release_worker_scratch_dir(self) -> None:
+        scratch = getattr(self._scratch, 'dir', None)
+        if scratch is not None:
+            scratch.cleanup()
+            self._scratch.dir = None
+
+    def _stage_export(self, item: _MigrationItem) -> _MigrationItem:
+        run_number = item.run_number
+        retries = self._config.app.run_process_retries
+        self._logger.info('→ Processing run %d (attempt %d/%d)', run_number, item.attempt + 1, retries + 1)
+        try:
+            tmpdir_path = self._worker_scratch_dir() / f'run_{run_number}'
+            shutil.rmtree(tmpdir_path, ignore_errors=True)
+            tmpdir_path.mkdir()
+        except OSError as e:
+            raise ArchiverError(f'Cannot create export scratch directory: {e}', stage='Migration', run_number=run_number, context={'scratch_dir': str(self._config.app.scratch_dir)}) from e
+        try:
+            self._logger.debug('Run %d: Exporting from ArtdaqDB', run_number)
+            self._artdaq.export_run_configuration(run_number, tmpdir_path)
+            self._logger.debug('Run %d: Creating data blob', run_number)
+            blob_bytes = self._blob_creator.create_blob_from_directory(run_number, tmpdir_path)
+        finally:
+            shutil.rmtree(tmpdir_path, ignore_errors=True)
+        self._logger.debug('Run %d: Generated blob size: %d bytes', run_number, len(blob_bytes))
+        return item._replace(blob=blob_bytes, md5=hashlib.md5(blob_bytes).hexdigest())
+
+    def _stage_upload(self, item: _MigrationItem) -> _MigrationItem:
+        self._logger.debug('Run %d: Uploading to UconDB', item.run_number)
+        self._ucon.upload_blob(item.run_number, item.blob)
+        self._logger.debug('Run %d: Upload successful', item.run_number)
+        return item
+
+    def _check_md5(self, item: _MigrationItem, downloaded_md5: str) -> None:
+        if item.md5 != downloaded_md5:
+            raise VerificationError(f'MD5 mismatch between generated and downloaded blobs', stage='Migration', run_number=item.run_number, context={'generated_md5': item.md5, 'downloaded_md5': downloaded_md5})
+        self._logger.debug('Run %d: MD5 verification passed (hash: %s)', item.run_number, item.md5)
+
+    def _stage_verify_fast(self, item: _MigrationItem) -> _MigrationItem:
+        run_number = item.run_number
+        data_url = self._get_ucondb_data_url(run_number)
+        self._logger.debug('Run %d: Verifying integrity from UconDB', run_number)
+        h2 = None
+        if self._config.app.trust_server_checksum:
+            h2 = self._fetch_server_md5(data_url)
+            if h2 is None:
+                self._logger.debug('Run %d: UconDB reported no checksum, downloading blob', run_number)
+            elif h2 != item.md5:
+                self._logger.debug('Run %d: UconDB-reported checksum %s does not match generated %s, downloading blob', run_number, h2, item.md5)
+                h2 = None
+        if h2 is None:
+            (h2, _) = self._download_blob_md5(run_number, data_url)
+        self._check_md5(item, h2)
+        self._logger.info('✓ Run %d migrated and verified successfully', run_number)
+        return item
+
+    def _stage_verify_validated(self, item: _MigrationItem) -> _MigrationItem:
+        run_number = item.run_number
+        data_url = self._get_ucondb_data_url(run_number)
+        self._logger.debug('Run %d: Verifying integrity from UconDB', run_number)
+        (h2, downloaded_bytes) = self._download_blob_md5(run_number, data_url, keep_content=True)
+        self._check_md5(item, h2)
+        self._logger.debug('Run %d: Validating blob metadata', run_number)
+        (error_count, results) = self._blob_validator.validate_blob(downloaded_bytes.decode('utf-8'), run_number)
+        if error_count > 0:
+            self._logger.warning('Run %d: Blob validation found %d errors: %s', run_number, error_count, results)
+        else:
+            self._logger.debug('Run %d: Blob validation passed: %s', run_number, results)
+        self._logger.info('✓ Run %d migrated and verified successfully', run_number)
+        return item
+
+    def _leave_pipeline(self) -> None:
+        with self._in_flight_lock:
+            self._in_flight -= 1
+
+    def _post_result(self, result_queue: queue.Queue, run_number: int, ok: bool, error: Optional[Exception]) -> None:
+        self._leave_pipeline()
+        result_queue.put((run_number, ok, error))
+
+    def _retry_or_fail(self, item: _MigrationItem, error: Exception, export_queue: queue.Queue, result_queue: queue.Queue) -> None:
+        retries = self._config.app.run_process_retries
+        self._logger.error('✗ Run %d failed (attempt %d/%d): %s', item.run_number, item.attempt + 1, retries + 1, error)
+        if item.attempt < retries and (not self._shutdown_event.is_set()):
+            self._logger.info('Retrying run %d in %d seconds...', item.run_number, self._config.app.retry_delay_seconds)
+            self._leave_pipeline()
+            export_queue.put(_MigrationItem(item.run_number, item.attempt + 1, not_before=time.monotonic() + self._config.app.retry_delay_seconds))
+        else:
+            self._post_result(result_queue, item.run_number, False, None)
+
+    def _stage_worker(self, stage: Callable[[_MigrationItem], _MigrationItem], in_queue: queue.Queue, out_queue: Optional[queue.Queue], export_queue: queue.Queue, result_queue: queue.Queue) -> None:
+        try:
+            while not (in_queue is export_queue and self._shutdown_event.is_set()):
+                item = in_queue.get()
+                if item is _WORK_SENTINEL:
+                    break
+                if in_queue is export_queue:
+                    with self._in_flight_lock:
+                        self._in_flight += 1
+                    delay = item.not_before - time.monotonic()
+                    if delay > 0 and self._shutdown_event.wait(delay):
+                        self._logger.info('Run %d: Shutdown requested - abandoning pending retry', item.run_number)
+                        self._post_result(result_queue, item.run_number, False, None)
+                        continue
+                try:
+                    item = stage(item)
+                except FuzzSkipError as e:
+                    self._logger.error('✗ Run %d permanently failed (fuzz skip): %s', item.run_number, e)
+                    self._post_result(result_queue, item.run_number, False, None)
+                    continue
+                except (ArchiverError, urllib3.exceptions.HTTPError) as e:
+                    self._retry_or_fail(item, e, export_queue, result_queue)
+                    continue
+                except Exception as e:
+                    self._post_result(result_queue, item.run_number, False, e)
+                    continue
+                if out_queue is None:
+                    self._post_result(result_queue, item.run_number, True, None)
+                else:
+                    out_queue.put(item)
+        finally:
+            self._release_worker_scratch_dir()
+
+    def _stop_pipeline(self, stages: List[Tuple[queue.Queue, List[threading.Thread]]]) -> None:
+        for (in_queue, workers) in stages:
+            for _ in workers:
+                in_queue.put(_WORK_SENTINEL)
+            for worker in workers:
+                worker.join()
+
+    def _record_result(self, run: int, ok: bool, error: Optional[Exception], successful: array.array, failed: array.array, failure_log: state.FailureLogWriter) -> None:
+        if error is not None:
+            self._logger.error('Migration Stage: Run %d failed with unhandled exception: %s', run, error, exc_info=error)
+            failed.append(run)
+            failure_log.add(run)
+        elif ok:
+            successful.append(run)
+        else:
+            failed.append(run)
+            failure_log.add(run)
+
+    def _process_batch(self, runs: List[int]) -> tuple[array.array, array.array]:
+        (successful, failed) = (array.array('i'), array.array('i'))
         total = len(runs)
-        max_workers = self._config.app.parallel_workers if self._artdaq.use_tools else 1
-        self._logger.info('Starting parallel processing of %d runs with %d workers', total, max_workers)
-        with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            future_to_run = {executor.submit(self._process_run, run): run for run in runs}
+        max_workers = bounded_worker_count(self._config.app.parallel_workers) if self._artdaq.use_tools else 1
+        if max_workers < self._config.app.parallel_workers:
+            self._logger.info('Capping parallel workers at %d (configured: %d, CPUs: %d)', max_workers, self._config.app.parallel_workers, os.cpu_count() or 1)
+        self._logger.info('Starting pipelined processing of %d runs with %d workers per stage', total, max_workers)
+        export_queue: queue.Queue = queue.Queue()
+        upload_queue: queue.Queue = queue.Queue(maxsize=max_workers)
+        verify_queue: queue.Queue = queue.Queue(maxsize=max_workers)
+        result_queue: queue.Queue = queue.Queue()
+        self._in_flight = 0
+        for run in runs:
+            export_queue.put(_MigrationItem(run, 0))
+        stages = []
+        for (name, stage, in_queue, out_queue) in (('Export', self._stage_export, export_queue, upload_queue), ('Upload', self._stage_upload, upload_queue, verify_queue), ('Verify', self._verify_one, verify_queue, None)):
+            workers = [threading.Thread(target=self._stage_worker, args=(stage, in_queue, out_queue, export_queue, result_queue), name=f'Migration{name}Worker-{i}', daemon=True) for i in range(max_workers)]
+            for worker in workers:
+                worker.start()
+            stages.append((in_queue, workers))
+        progress_interval = max(PROGRESS_REPORT_INTERVAL, total // PROGRESS_REPORTS_PER_BATCH)
+        with state.FailureLogWriter(self._config.app.migrate_failure_log) as failure_log:
             completed_count = 0
             shutdown_triggered = False
-            for future in as_completed(future_to_run):
-                run = future_to_run[future]
-                completed_count += 1
+            while completed_count < total:
                 try:
-                    if future.result():
-                        successful.append(run)
-                    else:
-                        failed.append(run)
-                except Exception as e:
-                    self._logger.exception('Migration Stage: Run %d failed with unhandled exception: %s', run, e)
-                    failed.append(run)
-                if completed_count % 10 == 0 or completed_count == total:
-                    self._logger.info('Progress: %d/%d runs processed (%d successful, %d failed)', completed_count, total, len(successful), len(failed))
-                if self._shutdown_check():
+                    (run, ok, error) = result_queue.get(timeout=BATCH_RESULT_POLL_SECONDS)
+                except queue.Empty:
+                    run = None
+                if run is not None:
+                    completed_count += 1
+                    self._record_result(run, ok, error, successful, failed, failure_log)
+                    if completed_count % progress_interval == 0 or completed_count == total:
+                        self._logger.info('Progress: %d/%d runs processed (%d successful, %d failed)', completed_count, total, len(successful), len(failed))
+                if self._shutdown_event.is_set() and completed_count < total:
                     shutdown_triggered = True
-                    cancelled_count = 0
-                    for pending_future in future_to_run.keys():
-                        if not pending_future.done():
-                            if pending_future.cancel():
-                                cancelled_count += 1
-                    remaining = total - completed_count
-                    if remaining > 0:
-                        self._logger.warning('Shutdown requested - cancelled %d pending runs. %d runs in progress will complete.', cancelled_count, remaining - cancelled_count)
-                    if remaining - cancelled_count > 0:
-                        self._logger.info('Waiting for %d in-progress runs to complete...', remaining - cancelled_count)
-                        for pending_future in future_to_run.keys():
-                            if not pending_future.done() and (not pending_future.cancelled()):
-                                pending_run = future_to_run[pending_future]
-                                try:
-                                    if pending_future.result():
-                                        successful.append(pending_run)
-                                    else:
-                                        failed.append(pending_run)
-                                except Exception as e:
-                                    self._logger.exception('Migration Stage: Run %d failed during shutdown: %s', pending_run, e)
-                                    failed.append(pending_run)
+                    with self._in_flight_lock:
+                        in_progress_count = self._in_flight
+                    self._logger.warning('Shutdown requested - no further runs will be started. %d runs in progress will complete.', in_progress_count)
+                    if in_progress_count > 0:
+                        self._logger.info('Waiting for runs already in the pipeline to complete...')
                     break
+            self._stop_pipeline(stages)
             if shutdown_triggered:
-                cancelled_runs = [future_to_run[f] for f in future_to_run.keys() if f.cancelled()]
-                if cancelled_runs:
-                    self._logger.info('Marking %d cancelled runs as not processed', len(cancelled_runs))
-        if shutdown_triggered:
-            self._logger.info('Batch processing interrupted by shutdown: %d successful, %d failed, %d not processed', len(successful), len(failed), total - len(successful) - len(failed))
-        else:
-            self._logger.info('Batch processing complete: %d successful, %d failed', len(successful), len(failed))
+                while True:
+                    try:
+                        (run, ok, error) = result_queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    completed_count += 1
+                    self._record_result(run, ok, error, successful, failed, failure_log)
+                if total - completed_count > 0:
+                    self._logger.info('Marking %d pending runs as not processed', total - completed_count)
+                self._logger.info('Batch processing interrupted by shutdown: %d successful, %d failed, %d not processed', len(successful), len(failed), total - len(successful) - len(failed))
+            else:
+                self._logger.info('Batch processing complete: %d successful, %d failed', len(successful), len(failed))
         if failed:
-            self._logger.warning('Recording %d failed runs to failure log', len(failed))
-            state.append_to_failure_log(self._config.app.migrate_failure_log, failed)
+            self._logger.warning('Recorded %d failed runs to failure log', len(failed))
             send_failure_report(failed, self._config.reporting, 'migration')
         return (successful, failed)
 
     def _update_metrics(self, processed: int, successful: int, max_run: Optional[int]) -> None:
         if self._carbon_client and self._carbon_client.enabled:
-            self._carbon_client.post_metric('migrate.runs_processed', processed)
-            self._carbon_client.post_metric('migrate.runs_successful', successful)
-            self._carbon_client.post_metric('migrate.runs_failed', processed - successful)
+            metrics = [('migrate.runs_processed', processed), ('migrate.runs_successful', successful), ('migrate.runs_failed', processed - successful)]
             if max_run is not None:
-                self._carbon_client.post_metric('migrate.last_successful_run', max_run)
+                metrics.append(('migrate.last_successful_run', max_run))
+            self._carbon_client.post_metrics(metrics)
 
     def run(self, incremental: bool, migrate_only: bool=False, validate: bool=False) -> int:
-        self._validate_blobs = validate
+        self._verify_one = self._stage_verify_validated if validate else self._stage_verify_fast
         if validate:
             self._logger.info('Migration Stage: Blob validation enabled')
         try:
@@ -196,9 +346,10 @@ class Migrator:
         attempted_runs = successful + failed
         self._update_metrics(len(attempted_runs), len(successful), max_success)
         self._logger.info('Updating state tracking: %d successful, %d attempted', len(successful), len(attempted_runs))
-        state.update_contiguous_run_state(self._config.app.migrate_state_file, successful)
-        state.update_attempted_run_state(self._config.app.migrate_state_file, attempted_runs)
-        if self._shutdown_check():
+        state.update_contiguous_run_state(self._config.app.migrate_state_file, successful, durable=False)
+        state.update_attempted_run_state(self._config.app.migrate_state_file, attempted_runs, durable=False)
+        state.sync_state(self._config.app.migrate_state_file)
+        if self._shutdown_event.is_set():
             self._logger.info('Migration Stage: Shutdown requested - state saved, exiting gracefully')
             return 1
         return 1 if len(successful) < len(batch) else 0
@@ -214,26 +365,27 @@ class Migrator:
             return 0
         self._logger.debug('Querying UconDB to filter already-migrated runs...')
         migrated_runs = self._ucon.get_existing_runs()
-        already_migrated = sorted(list(set(failed_runs) & migrated_runs))
-        runs_to_retry = sorted(list(set(failed_runs) - migrated_runs))
+        failed_set = set(failed_runs)
+        already_migrated = failed_set & migrated_runs
+        runs_to_retry = sorted(failed_set - migrated_runs)
         if already_migrated:
-            self._logger.info('Found %d run(s) already migrated, removing from failure log: %s', len(already_migrated), already_migrated[:10] if len(already_migrated) > 10 else already_migrated)
+            self._logger.info('Found %d run(s) already migrated, removing from failure log: %s', len(already_migrated), sorted(already_migrated)[:10])
         if not runs_to_retry:
             self._logger.info('All failed runs are already migrated. Nothing to retry.')
             state.write_failure_log(failure_log, [])
             return 0
         self._logger.info('Migration Stage: Attempting to recover %d failed runs.', len(runs_to_retry))
         (successful, failed) = self._process_batch(runs_to_retry)
-        all_successful = sorted(list(set(successful) | set(already_migrated)))
-        remaining = sorted(list(set(failed_runs) - set(all_successful)))
+        all_successful = already_migrated.union(successful)
+        remaining = failed_set - all_successful
         state.write_failure_log(failure_log, remaining)
         attempted_runs = successful + failed
         self._logger.info('Updating state tracking after recovery: %d newly migrated, %d total attempted in recovery', len(successful), len(attempted_runs))
-        self._logger.debug('Querying all migrated runs for state update...')
-        all_migrated = self._ucon.get_existing_runs()
-        state.update_contiguous_run_state(self._config.app.migrate_state_file, sorted(list(all_migrated)))
-        state.update_attempted_run_state(self._config.app.migrate_state_file, attempted_runs)
-        if self._shutdown_check():
+        all_migrated = migrated_runs.union(successful)
+        state.update_contiguous_run_state(self._config.app.migrate_state_file, all_migrated, durable=False)
+        state.update_attempted_run_state(self._config.app.migrate_state_file, attempted_runs, durable=False)
+        state.sync_state(self._config.app.migrate_state_file)
+        if self._shutdown_event.is_set():
             self._logger.info('Migration Recovery: Shutdown requested - state saved, exiting gracefully')
             return 1
         self._logger.info('Migration Stage: Recovery complete. %d successful (%d already migrated, %d newly migrated), %d remaining.', len(all_successful), len(already_migrated), len(successful), len(remaining))
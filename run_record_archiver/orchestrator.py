@@ -1,17 +1,33 @@
+import itertools
 import logging
 import threading
-import time
+from functools import cached_property
 from typing import Optional
 from .clients.artdaq import ArtdaqDBClient
-from .clients.carbon import CarbonClient
+from .clients.carbon import BatchingCarbonClient
 from .clients.ucondb import UconDBClient
 from .config import Config
+from .constants import LOCK_MONITOR_POLL_SECONDS
 from .exceptions import ArchiverError
 from .importer import Importer
 from .migrator import Migrator
-from .persistence.lock import FileLock
+from .persistence import state
+from .persistence.lock import FileLock, LockFileWatcher
 from .reporter import Reporter
 from .services.blob_creator import BlobCreator
+from .utils import find_last_contiguous_run, scan_run_directories
+
+def _describe_execution_mode(incremental: bool, import_only: bool, migrate_only: bool, retry_failed_import: bool, retry_failed_migrate: bool) -> str:
+    if retry_failed_import:
+        return 'Retry Failed Imports'
+    if retry_failed_migrate:
+        return 'Retry Failed Migrations'
+    if import_only:
+        return f"Import Only ({('Incremental' if incremental else 'Full')})"
+    if migrate_only:
+        return f"Migration Only ({('Incremental' if incremental else 'Full')})"
+    return f"Full Pipeline ({('Incremental' if incremental else 'Full')})"
+_EXECUTION_MODE_DESCRIPTIONS = {flags: _describe_execution_mode(*flags) for flags in itertools.product((False, True), repeat=5)}
 
 class Orchestrator:
 
@@ -20,23 +36,52 @@ class Orchestrator:
         self._logger = logging.getLogger(__name__)
         self._current_stage: Optional[str] = None
         self._last_error: Optional[Exception] = None
-        self._shutdown_requested = False
+        self._shutdown_event = threading.Event()
         self._shutdown_reason: Optional[str] = None
         self._lock_monitor_thread: Optional[threading.Thread] = None
         self._lock_monitor_stop_event = threading.Event()
+        self._lock_watcher: Optional[LockFileWatcher] = None
         self._file_lock: Optional[FileLock] = None
-        self._logger.info('Initializing Run Record Archiver components...')
         self._logger.debug('Configuration: work_dir=%s, batch_size=%d, workers=%d', config.app.work_dir, config.app.batch_size, config.app.parallel_workers)
-        self.carbon_client = CarbonClient(host=config.carbon.host, port=config.carbon.port, metric_prefix=config.carbon.metric_prefix, enabled=config.carbon.enabled)
-        self.artdaq_client = ArtdaqDBClient(database_uri=config.artdaq_db.database_uri, use_tools=config.artdaq_db.use_tools, remote_host=config.artdaq_db.remote_host, carbon_client=self.carbon_client, random_skip_percent=config.app_fuzz.random_skip_percent, random_error_percent=config.app_fuzz.random_error_percent, random_skip_retry=config.app_fuzz.random_skip_retry, random_error_retry=config.app_fuzz.random_error_retry)
-        self.ucon_client = UconDBClient(config.ucon_db, self.carbon_client, random_skip_percent=config.app_fuzz.random_skip_percent, random_error_percent=config.app_fuzz.random_error_percent, random_skip_retry=config.app_fuzz.random_skip_retry, random_error_retry=config.app_fuzz.random_error_retry)
-        self.blob_creator = BlobCreator()
-        self.importer = Importer(config, self.artdaq_client)
-        self.migrator = Migrator(config, self.artdaq_client, self.ucon_client, self.blob_creator, self.carbon_client)
-        self.reporter = Reporter(config, self.artdaq_client, self.ucon_client)
-        self.importer.set_shutdown_check(self.is_shutdown_requested)
-        self.migrator.set_shutdown_check(self.is_shutdown_requested)
-        self._logger.info('All components initialized successfully.')
+
+    @cached_property
+    def carbon_client(self) -> BatchingCarbonClient:
+        config = self._config
+        return BatchingCarbonClient(host=config.carbon.host, port=config.carbon.port, metric_prefix=config.carbon.metric_prefix, enabled=config.carbon.enabled)
+
+    @cached_property
+    def artdaq_client(self) -> ArtdaqDBClient:
+        config = self._config
+        return ArtdaqDBClient(database_uri=config.artdaq_db.database_uri, use_tools=config.artdaq_db.use_tools, remote_host=config.artdaq_db.remote_host, carbon_client=self.carbon_client, random_skip_percent=config.app_fuzz.random_skip_percent, random_error_percent=config.app_fuzz.random_error_percent, random_skip_retry=config.app_fuzz.random_skip_retry, random_error_retry=config.app_fuzz.random_error_retry)
+
+    @cached_property
+    def ucon_client(self) -> UconDBClient:
+        config = self._config
+        return UconDBClient(config.ucon_db, self.carbon_client, random_skip_percent=config.app_fuzz.random_skip_percent, random_error_percent=config.app_fuzz.random_error_percent, random_skip_retry=config.app_fuzz.random_skip_retry, random_error_retry=config.app_fuzz.random_error_retry)
+
+    @cached_property
+    def blob_creator(self) -> BlobCreator:
+        return BlobCreator()
+
+    @cached_property
+    def importer(self) -> Importer:
+        importer = Importer(self._config, self.artdaq_client)
+        importer.set_shutdown_event(self._shutdown_event)
+        return importer
+
+    @cached_property
+    def migrator(self) -> Migrator:
+        migrator = Migrator(self._config, self.artdaq_client, self.ucon_client, self.blob_creator, self.carbon_client)
+        migrator.set_shutdown_event(self._shutdown_event)
+        return migrator
+
+    @cached_property
+    def reporter(self) -> Reporter:
+        return Reporter(self._config, self.artdaq_client, self.ucon_client)
+
+    def close(self) -> None:
+        if 'carbon_client' in self.__dict__:
+            self.carbon_client.close()
 
     def run(self, incremental: bool, import_only: bool, migrate_only: bool, retry_failed_import: bool, retry_failed_migrate: bool, report_status: bool=False, compare_state: bool=False, validate: bool=False) -> int:
         import_rc = 0
@@ -58,37 +103,31 @@ class Orchestrator:
                 self._current_stage = None
         mode_desc = self._get_execution_mode_description(incremental, import_only, migrate_only, retry_failed_import, retry_failed_migrate)
         self._logger.info('=== Execution Mode: %s ===', mode_desc)
-        self.artdaq_client.set_incremental_mode(incremental)
-        self.ucon_client.set_incremental_mode(incremental)
+        runs_import = retry_failed_import or (not migrate_only and (not retry_failed_migrate))
+        runs_migrate = retry_failed_migrate or (not import_only and (not retry_failed_import))
+        if runs_import or runs_migrate:
+            self.artdaq_client.set_incremental_mode(incremental)
+        if runs_migrate:
+            self.ucon_client.set_incremental_mode(incremental)
         try:
             if retry_failed_import:
                 self._current_stage = 'Import Recovery'
-                self._logger.info('=' * 60)
-                self._logger.info('STAGE: Import Recovery - Retrying failed imports')
-                self._logger.info('=' * 60)
+                self._log_banner('STAGE: Import Recovery - Retrying failed imports')
                 import_rc = self.importer.run_failure_recovery()
                 self._log_stage_completion('Import Recovery', import_rc)
             elif not migrate_only and (not retry_failed_migrate):
                 self._current_stage = 'Import'
-                self._logger.info('=' * 60)
-                self._logger.info('STAGE: Import - Importing runs from filesystem to ArtdaqDB')
-                self._logger.info('Mode: %s', 'Incremental' if incremental else 'Full')
-                self._logger.info('=' * 60)
+                self._log_banner('STAGE: Import - Importing runs from filesystem to ArtdaqDB', f"Mode: {('Incremental' if incremental else 'Full')}")
                 import_rc = self.importer.run(incremental=incremental, import_only=import_only)
                 self._log_stage_completion('Import', import_rc)
             if retry_failed_migrate:
                 self._current_stage = 'Migration Recovery'
-                self._logger.info('=' * 60)
-                self._logger.info('STAGE: Migration Recovery - Retrying failed migrations')
-                self._logger.info('=' * 60)
+                self._log_banner('STAGE: Migration Recovery - Retrying failed migrations')
                 migrate_rc = self.migrator.run_failure_recovery()
                 self._log_stage_completion('Migration Recovery', migrate_rc)
             elif not import_only and (not retry_failed_import):
                 self._current_stage = 'Migration'
-                self._logger.info('=' * 60)
-                self._logger.info('STAGE: Migration - Migrating runs from ArtdaqDB to UconDB')
-                self._logger.info('Mode: %s', 'Incremental' if incremental else 'Full')
-                self._logger.info('=' * 60)
+                self._log_banner('STAGE: Migration - Migrating runs from ArtdaqDB to UconDB', f"Mode: {('Incremental' if incremental else 'Full')}")
                 migrate_rc = self.migrator.run(incremental=incremental, migrate_only=migrate_only, validate=validate)
                 self._log_stage_completion('Migration', migrate_rc)
         except ArchiverError as e:
@@ -104,16 +143,12 @@ class Orchestrator:
             self._stop_lock_monitor()
         return import_rc or migrate_rc
 
+    def _log_banner(self, *lines: str, width: int=60) -> None:
+        rule = '=' * width
+        self._logger.info('%s', '\n'.join(('', rule, *lines, rule)))
+
     def _get_execution_mode_description(self, incremental: bool, import_only: bool, migrate_only: bool, retry_failed_import: bool, retry_failed_migrate: bool) -> str:
-        if retry_failed_import:
-            return 'Retry Failed Imports'
-        if retry_failed_migrate:
-            return 'Retry Failed Migrations'
-        if import_only:
-            return f"Import Only ({('Incremental' if incremental else 'Full')})"
-        if migrate_only:
-            return f"Migration Only ({('Incremental' if incremental else 'Full')})"
-        return f"Full Pipeline ({('Incremental' if incremental else 'Full')})"
+        return _EXECUTION_MODE_DESCRIPTIONS[bool(incremental), bool(import_only), bool(migrate_only), bool(retry_failed_import), bool(retry_failed_migrate)]
 
     def _log_stage_completion(self, stage_name: str, exit_code: int) -> None:
         if exit_code == 0:
@@ -128,13 +163,13 @@ class Orchestrator:
         return self._last_error
 
     def request_shutdown(self, reason: str='User request') -> None:
-        if not self._shutdown_requested:
-            self._shutdown_requested = True
+        if not self._shutdown_event.is_set():
             self._shutdown_reason = reason
+            self._shutdown_event.set()
             self._logger.info('Shutdown requested (%s) - will stop after current run completes', reason)
 
     def is_shutdown_requested(self) -> bool:
-        return self._shutdown_requested
+        return self._shutdown_event.is_set()
 
     def get_shutdown_reason(self) -> Optional[str]:
         return self._shutdown_reason
@@ -147,14 +182,20 @@ class Orchestrator:
         if self._file_lock is None:
             return
         self._lock_monitor_stop_event.clear()
+        try:
+            self._lock_watcher = LockFileWatcher(self._file_lock.lock_file)
+        except OSError as e:
+            self._logger.debug('Lock file watch unavailable (%s), polling every %.1fs', e, LOCK_MONITOR_POLL_SECONDS)
+            self._lock_watcher = None
         self._lock_monitor_thread = threading.Thread(target=self._lock_monitor_worker, name='LockMonitor', daemon=True)
         self._lock_monitor_thread.start()
         self._logger.debug('Lock monitor thread started (PID: %d)', self._file_lock.get_pid())
 
     def _lock_monitor_worker(self) -> None:
-        poll_interval = 1.0
+        watcher = self._lock_watcher
+        check_needed = True
         while not self._lock_monitor_stop_event.is_set():
-            if self._file_lock and (not self._file_lock.is_lock_file_valid()):
+            if check_needed and self._file_lock and (not self._file_lock.is_lock_file_valid()):
                 self._logger.warning('=' * 70)
                 self._logger.warning('LOCK FILE REMOVED - INITIATING GRACEFUL SHUTDOWN')
                 self._logger.warning('Lock file: %s', self._file_lock.lock_file)
@@ -162,23 +203,18 @@ class Orchestrator:
                 self._logger.warning('=' * 70)
                 self.request_shutdown(reason='Lock file removed')
                 break
-            for _ in range(int(poll_interval * 10)):
-                if self._lock_monitor_stop_event.is_set():
-                    break
-                time.sleep(0.1)
+            if watcher is not None:
+                check_needed = watcher.wait(None)
+            elif self._lock_monitor_stop_event.wait(timeout=LOCK_MONITOR_POLL_SECONDS):
+                break
 
     def recover_import_state(self) -> int:
         self._current_stage = 'Import State Recovery'
-        self._logger.info('=' * 70)
-        self._logger.info('IMPORT STATE RECOVERY')
-        self._logger.info('=' * 70)
+        self._log_banner('IMPORT STATE RECOVERY', width=70)
         try:
             self._logger.info('Querying filesystem for run records...')
-            fs_runs = set()
             try:
-                for p in self._config.source_files.run_records_dir.iterdir():
-                    if p.is_dir() and p.name.isdigit():
-                        fs_runs.add(int(p.name))
+                fs_runs = scan_run_directories(self._config.source_files.run_records_dir)
             except (IOError, PermissionError) as e:
                 raise ArchiverError(f'Cannot read run records directory: {e}', stage='Import State Recovery', context={'directory': str(self._config.source_files.run_records_dir)}) from e
             self._logger.info('Found %d runs in filesystem', len(fs_runs))
@@ -187,32 +223,17 @@ class Orchestrator:
             self._logger.info('Found %d runs in artdaqDB', len(artdaq_runs))
             if not artdaq_runs:
                 self._logger.warning('No runs found in artdaqDB - setting state to 0')
-                from .persistence import state
                 state.write_state(self._config.app.import_state_file, {'last_contiguous_run': 0, 'last_attempted_run': 0})
                 state.write_failure_log(self._config.app.import_failure_log, [])
                 self._logger.info('✓ Import state recovered successfully')
                 return 0
-            last_attempted_run = max(artdaq_runs)
-            self._logger.info('Last attempted run: %d', last_attempted_run)
             sorted_runs = sorted(artdaq_runs)
-            if not sorted_runs:
-                last_contiguous_run = 0
-            else:
-                last_contiguous_run = sorted_runs[0]
-                for i in range(1, len(sorted_runs)):
-                    if sorted_runs[i] == last_contiguous_run + 1:
-                        last_contiguous_run = sorted_runs[i]
-                    else:
-                        break
+            last_attempted_run = sorted_runs[-1]
+            self._logger.info('Last attempted run: %d', last_attempted_run)
+            last_contiguous_run = find_last_contiguous_run(sorted_runs)
             self._logger.info('Last contiguous run: %d', last_contiguous_run)
-            missing_runs = []
-            for run in sorted(fs_runs):
-                if run > last_attempted_run:
-                    break
-                if run not in artdaq_runs:
-                    missing_runs.append(run)
+            missing_runs = sorted((run for run in fs_runs - artdaq_runs if run <= last_attempted_run))
             self._logger.info('Found %d missing runs to add to failure log', len(missing_runs))
-            from .persistence import state
             state.write_state(self._config.app.import_state_file, {'last_contiguous_run': last_contiguous_run, 'last_attempted_run': last_attempted_run})
             self._logger.info('✓ Written import_state.json')
             state.write_failure_log(self._config.app.import_failure_log, missing_runs)
@@ -237,9 +258,7 @@ class Orchestrator:
 
     def recover_migrate_state(self) -> int:
         self._current_stage = 'Migration State Recovery'
-        self._logger.info('=' * 70)
-        self._logger.info('MIGRATION STATE RECOVERY')
-        self._logger.info('=' * 70)
+        self._log_banner('MIGRATION STATE RECOVERY', width=70)
         try:
             self._logger.info('Querying artdaqDB for available runs...')
             artdaq_runs = self.artdaq_client.get_archived_runs()
@@ -249,32 +268,17 @@ class Orchestrator:
             self._logger.info('Found %d runs in UconDB', len(ucon_runs))
             if not ucon_runs:
                 self._logger.warning('No runs found in UconDB - setting state to 0')
-                from .persistence import state
                 state.write_state(self._config.app.migrate_state_file, {'last_contiguous_run': 0, 'last_attempted_run': 0})
                 state.write_failure_log(self._config.app.migrate_failure_log, [])
                 self._logger.info('✓ Migration state recovered successfully')
                 return 0
-            last_attempted_run = max(ucon_runs)
-            self._logger.info('Last attempted run: %d', last_attempted_run)
             sorted_runs = sorted(ucon_runs)
-            if not sorted_runs:
-                last_contiguous_run = 0
-            else:
-                last_contiguous_run = sorted_runs[0]
-                for i in range(1, len(sorted_runs)):
-                    if sorted_runs[i] == last_contiguous_run + 1:
-                        last_contiguous_run = sorted_runs[i]
-                    else:
-                        break
+            last_attempted_run = sorted_runs[-1]
+            self._logger.info('Last attempted run: %d', last_attempted_run)
+            last_contiguous_run = find_last_contiguous_run(sorted_runs)
             self._logger.info('Last contiguous run: %d', last_contiguous_run)
-            missing_runs = []
-            for run in sorted(artdaq_runs):
-                if run > last_attempted_run:
-                    break
-                if run not in ucon_runs:
-                    missing_runs.append(run)
+            missing_runs = sorted((run for run in artdaq_runs - ucon_runs if run <= last_attempted_run))
             self._logger.info('Found %d missing runs to add to failure log', len(missing_runs))
-            from .persistence import state
             state.write_state(self._config.app.migrate_state_file, {'last_contiguous_run': last_contiguous_run, 'last_attempted_run': last_attempted_run})
             self._logger.info('✓ Written migrate_state.json')
             state.write_failure_log(self._config.app.migrate_failure_log, missing_runs)
@@ -300,5 +304,13 @@ class Orchestrator:
     def _stop_lock_monitor(self) -> None:
         if self._lock_monitor_thread and self._lock_monitor_thread.is_alive():
             self._lock_monitor_stop_event.set()
+            if self._lock_watcher is not None:
+                self._lock_watcher.wake()
             self._lock_monitor_thread.join(timeout=2.0)
-            self._logger.debug('Lock monitor thread stopped')
\ No newline at end of file
+            if self._lock_monitor_thread.is_alive():
+                self._logger.warning('Lock monitor thread did not stop within 2s; leaving its lock file watcher open')
+                return
+            self._logger.debug('Lock monitor thread stopped')
+        if self._lock_watcher is not None:
+            self._lock_watcher.close()
+            self._lock_watcher = None
\ No newline at end of file
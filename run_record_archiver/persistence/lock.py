@@ -1,49 +1,102 @@
+import ctypes
+import ctypes.util
 import fcntl
 import os
+import select
 from pathlib import Path
+from typing import Optional, Tuple
 from ..exceptions import LockExistsError
+_IN_MODIFY = 0x2
+_IN_ATTRIB = 0x4
+_IN_DELETE_SELF = 0x400
+_IN_MOVE_SELF = 0x800
 
 class FileLock:
 
     def __init__(self, lock_file: Path):
         self.lock_file = lock_file
-        self.lock_file_handle = None
+        self.lock_file_fd: Optional[int] = None
         self.pid = os.getpid()
+        self._pid_bytes = str(self.pid).encode()
+        self._valid_signature: Optional[Tuple[int, int, int]] = None
 
     def __enter__(self):
         try:
             self.lock_file.parent.mkdir(parents=True, exist_ok=True)
-            self.lock_file_handle = open(self.lock_file, 'w', encoding='utf-8')
-            fcntl.flock(self.lock_file_handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
-            self.lock_file_handle.write(f'{self.pid}\n')
-            self.lock_file_handle.flush()
+            self.lock_file_fd = os.open(self.lock_file, os.O_WRONLY | os.O_CREAT | os.O_CLOEXEC, 0o644)
+            fcntl.flock(self.lock_file_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            os.ftruncate(self.lock_file_fd, 0)
+            os.write(self.lock_file_fd, self._pid_bytes + b'\n')
             return self
-        except (IOError, BlockingIOError) as exc:
-            if self.lock_file_handle:
-                self.lock_file_handle.close()
+        except OSError as exc:
+            if self.lock_file_fd is not None:
+                os.close(self.lock_file_fd)
+                self.lock_file_fd = None
             raise LockExistsError(f"Another process may be running. Lock file '{self.lock_file}' is held.") from exc
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        if self.lock_file_handle:
-            fcntl.flock(self.lock_file_handle, fcntl.LOCK_UN)
-            self.lock_file_handle.close()
-            self.lock_file_handle = None
+        if self.lock_file_fd is not None:
+            fcntl.flock(self.lock_file_fd, fcntl.LOCK_UN)
+            os.close(self.lock_file_fd)
+            self.lock_file_fd = None
 
     def is_lock_file_valid(self) -> bool:
         try:
-            if not self.lock_file.exists():
-                return False
-            with open(self.lock_file, 'r', encoding='utf-8') as f:
-                content = f.read().strip()
-                if not content:
-                    return False
-                try:
-                    file_pid = int(content)
-                    return file_pid == self.pid
-                except ValueError:
-                    return False
-        except (IOError, PermissionError):
+            st = os.stat(self.lock_file)
+        except OSError:
             return False
+        signature = (st.st_ino, st.st_mtime_ns, st.st_size)
+        if signature == self._valid_signature:
+            return True
+        try:
+            fd = os.open(self.lock_file, os.O_RDONLY | os.O_CLOEXEC)
+        except OSError:
+            return False
+        try:
+            content = os.read(fd, 32)
+        except OSError:
+            return False
+        finally:
+            os.close(fd)
+        if content.strip() != self._pid_bytes:
+            return False
+        self._valid_signature = signature
+        return True
 
     def get_pid(self) -> int:
-        return self.pid
\ No newline at end of file
+        return self.pid
+
+class LockFileWatcher:
+
+    def __init__(self, lock_file: Path):
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        if not hasattr(libc, 'inotify_init1'):
+            raise OSError('inotify is not available on this platform')
+        self._fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        if libc.inotify_add_watch(self._fd, os.fsencode(lock_file), _IN_MODIFY | _IN_ATTRIB | _IN_DELETE_SELF | _IN_MOVE_SELF) < 0:
+            errno = ctypes.get_errno()
+            os.close(self._fd)
+            raise OSError(errno, f'inotify_add_watch failed for {lock_file}')
+        (self._wake_r, self._wake_w) = os.pipe()
+
+    def wait(self, timeout: Optional[float]) -> bool:
+        (readable, _, _) = select.select([self._fd, self._wake_r], [], [], timeout)
+        if self._fd not in readable:
+            return False
+        try:
+            while os.read(self._fd, 4096):
+                pass
+        except BlockingIOError:
+            pass
+        return True
+
+    def wake(self) -> None:
+        os.write(self._wake_w, b'\0')
+
+    def close(self) -> None:
+        if self._fd >= 0:
+            for fd in (self._fd, self._wake_r, self._wake_w):
+                os.close(fd)
+            self._fd = -1
\ No newline at end of file
@@ -1,43 +1,106 @@
+import bisect
 import json
 import logging
+import os
 from pathlib import Path
-from typing import Any, Dict, List
+from typing import Any, Dict, Iterable, List, Optional, TextIO, Tuple
+from ..constants import FAILURE_LOG_FLUSH_INTERVAL
+from ..utils import find_last_contiguous_run
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+STATE_CACHE_ENABLED = True
+_STATE_CACHE: Dict[Path, Tuple[Tuple[int, int], Dict[str, Any]]] = {}
+
+def _file_signature(state_file: Path) -> Tuple[int, int]:
+    st = state_file.stat()
+    return (st.st_mtime_ns, st.st_size)
+
+def _dump_state(state: Dict[str, Any]) -> bytes:
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(state, option=orjson.OPT_INDENT_2)
+    return json.dumps(state, indent=2).encode('utf-8')
+
+def _content_unchanged(path: Path, data: bytes) -> bool:
+    try:
+        return path.stat().st_size == len(data) and path.read_bytes() == data
+    except OSError:
+        return False
 
 def read_state(state_file: Path) -> Dict[str, Any]:
     try:
         if state_file.exists():
+            signature = _file_signature(state_file)
+            cached = _STATE_CACHE.get(state_file) if STATE_CACHE_ENABLED else None
+            if cached is not None and cached[0] == signature:
+                return cached[1].copy()
             with open(state_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
+                data = json.load(f)
+            if STATE_CACHE_ENABLED:
+                _STATE_CACHE[state_file] = (signature, data.copy())
+            return data
     except (IOError, json.JSONDecodeError) as e:
         logging.getLogger(__name__).warning('Failed to read state file %s: %s', state_file, e)
     return {}
 
-def write_state(state_file: Path, state: Dict[str, Any]) -> bool:
+def _fsync_directory(directory: Path) -> None:
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def write_state(state_file: Path, state: Dict[str, Any], *, durable: bool=True) -> bool:
     try:
         state_file.parent.mkdir(parents=True, exist_ok=True)
-        with open(state_file, 'w', encoding='utf-8') as f:
-            json.dump(state, f, indent=2)
+        data = _dump_state(state)
+        if not _content_unchanged(state_file, data):
+            tmp_file = state_file.with_name(f'{state_file.name}.tmp')
+            with open(tmp_file, 'wb') as f:
+                f.write(data)
+                if durable:
+                    f.flush()
+                    os.fsync(f.fileno())
+            os.replace(tmp_file, state_file)
+            if durable:
+                _fsync_directory(state_file.parent)
+        if STATE_CACHE_ENABLED:
+            _STATE_CACHE[state_file] = (_file_signature(state_file), state.copy())
         return True
     except (IOError, TypeError) as e:
         logging.getLogger(__name__).error('Failed to write state file %s: %s', state_file, e)
         return False
 
-def update_contiguous_run_state(state_file: Path, successful_runs: List[int]) -> None:
+def sync_state(state_file: Path) -> None:
+    if not state_file.exists():
+        return
+    try:
+        fd = os.open(state_file, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        _fsync_directory(state_file.parent)
+    except OSError as e:
+        logging.getLogger(__name__).error('Failed to sync state file %s: %s', state_file, e)
+
+def update_contiguous_run_state(state_file: Path, successful_runs: Iterable[int], *, durable: bool=True) -> None:
     if not successful_runs:
         return
     current_state = read_state(state_file)
     last_run = current_state.get('last_contiguous_run', 0)
-    for run in sorted(successful_runs):
-        if run == last_run + 1:
-            last_run = run
-        elif run > last_run + 1:
-            break
+    sorted_runs = sorted(set(successful_runs))
+    start = bisect.bisect_left(sorted_runs, last_run + 1)
+    if start < len(sorted_runs) and sorted_runs[start] == last_run + 1:
+        last_run = find_last_contiguous_run(sorted_runs, start)
     if last_run > current_state.get('last_contiguous_run', 0):
         current_state['last_contiguous_run'] = last_run
-        write_state(state_file, current_state)
+        write_state(state_file, current_state, durable=durable)
         logging.getLogger(__name__).info('Updated last contiguous run in %s to %d', state_file.name, last_run)
 
-def update_attempted_run_state(state_file: Path, attempted_runs: List[int]) -> None:
+def update_attempted_run_state(state_file: Path, attempted_runs: List[int], *, durable: bool=True) -> None:
     if not attempted_runs:
         return
     current_state = read_state(state_file)
@@ -45,7 +108,7 @@ def update_attempted_run_state(state_file: Path, attempted_runs: List[int]) -> N
     new_last_attempted = max(max(attempted_runs), last_attempted)
     if new_last_attempted > last_attempted:
         current_state['last_attempted_run'] = new_last_attempted
-        write_state(state_file, current_state)
+        write_state(state_file, current_state, durable=durable)
         logging.getLogger(__name__).info('Updated last_attempted_run in %s: %d -> %d (processed %d runs: %d to %d)', state_file.name, last_attempted, new_last_attempted, len(attempted_runs), min(attempted_runs), max(attempted_runs))
     else:
         logging.getLogger(__name__).debug('No update needed for last_attempted_run in %s (current=%d, max_attempted=%d)', state_file.name, last_attempted, max(attempted_runs))
@@ -63,8 +126,7 @@ def parse_run_records_from_file(run_records_file: Path) -> List[int]:
     if not run_records_file.exists():
         return []
     try:
-        with open(run_records_file, 'r', encoding='utf-8') as f:
-            return [int(line.strip()) for line in f if line.strip().isdigit()]
+        return [int(token) for token in run_records_file.read_text(encoding='utf-8').split() if token.isdigit()]
     except (IOError, ValueError) as e:
         logging.getLogger(__name__).error('Failed to parse run records file %s: %s', run_records_file, e)
         return []
@@ -77,10 +139,45 @@ def append_to_failure_log(failure_log: Path, failed_runs: List[int]):
     except IOError as e:
         logging.getLogger(__name__).error('Could not write to failure log: %s', e)
 
-def write_failure_log(failure_log: Path, failed_runs: List[int]):
+def write_failure_log(failure_log: Path, failed_runs: Iterable[int]):
     try:
-        with failure_log.open('w', encoding='utf-8') as f:
-            for run in sorted(failed_runs):
-                f.write(f'{run}\n')
+        data = ''.join((f'{run}\n' for run in sorted(failed_runs))).encode('utf-8')
+        if failure_log.exists() and _content_unchanged(failure_log, data):
+            return
+        failure_log.write_bytes(data)
     except IOError as e:
-        logging.getLogger(__name__).error('Could not update failure log: %s', e)
\ No newline at end of file
+        logging.getLogger(__name__).error('Could not update failure log: %s', e)
+
+class FailureLogWriter:
+
+    def __init__(self, failure_log: Path, flush_every: int=FAILURE_LOG_FLUSH_INTERVAL):
+        self.failure_log = failure_log
+        self.flush_every = flush_every
+        self._buffer: List[int] = []
+        self._handle: Optional[TextIO] = None
+
+    def __enter__(self) -> 'FailureLogWriter':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.flush()
+        if self._handle is not None:
+            self._handle.close()
+            self._handle = None
+
+    def add(self, run: int) -> None:
+        self._buffer.append(run)
+        if len(self._buffer) >= self.flush_every:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self._buffer:
+            return
+        try:
+            if self._handle is None:
+                self._handle = self.failure_log.open('a', encoding='utf-8')
+            self._handle.write('\n'.join(map(str, sorted(self._buffer))) + '\n')
+            self._handle.flush()
+        except IOError as e:
+            logging.getLogger(__name__).error('Could not write to failure log: %s', e)
+        self._buffer.clear()
\ No newline at end of file
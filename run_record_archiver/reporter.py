@@ -1,11 +1,19 @@
+import bisect
+import heapq
+import itertools
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import List, Set, Tuple
+from typing import Iterable, List, Set, Tuple, Union
 from .clients.artdaq import ArtdaqDBClient
 from .clients.ucondb import UconDBClient
 from .config import Config
 from .exceptions import ArchiverError
 from .persistence import state
+from .utils import scan_run_directories
+
+def _join_ranges(ranges: Iterable[Tuple[int, int]]) -> str:
+    return ', '.join((f'{start}-{end}' if start != end else str(start) for (start, end) in ranges))
 
 class Reporter:
 
@@ -18,26 +26,21 @@ class Reporter:
     def _get_filesystem_runs(self) -> Set[int]:
         self._logger.debug('Scanning filesystem: %s', self._config.source_files.run_records_dir)
         try:
-            fs_runs = {int(p.name) for p in self._config.source_files.run_records_dir.iterdir() if p.is_dir() and p.name.isdigit()}
+            fs_runs = scan_run_directories(self._config.source_files.run_records_dir)
             self._logger.debug('Found %d runs in filesystem', len(fs_runs))
             return fs_runs
         except (IOError, PermissionError) as e:
             raise ArchiverError(f'Cannot read run records directory: {e}', stage='Reporter', context={'directory': str(self._config.source_files.run_records_dir)}) from e
 
-    def _compute_ranges_and_gaps(self, runs: Set[int]) -> Tuple[List[Tuple[int, int]], List[int]]:
-        if not runs:
+    def _compute_ranges_and_gaps(self, sorted_runs: List[int]) -> Tuple[List[Tuple[int, int]], List[int]]:
+        if not sorted_runs:
             return ([], [])
-        sorted_runs = sorted(runs)
-        min_run = sorted_runs[0]
-        max_run = sorted_runs[-1]
-        full_range = set(range(min_run, max_run + 1))
-        gaps = sorted(list(full_range - runs))
-        ranges = []
-        range_start = sorted_runs[0]
-        prev_run = sorted_runs[0]
-        for run in sorted_runs[1:]:
+        (ranges, gaps) = ([], [])
+        range_start = prev_run = sorted_runs[0]
+        for run in itertools.islice(sorted_runs, 1, None):
             if run != prev_run + 1:
                 ranges.append((range_start, prev_run))
+                gaps.extend(range(prev_run + 1, run))
                 range_start = run
             prev_run = run
         ranges.append((range_start, prev_run))
@@ -47,33 +50,29 @@ class Reporter:
         if not ranges:
             return 'None'
         if len(ranges) <= max_display:
-            return ', '.join((f'{start}-{end}' if start != end else str(start) for (start, end) in ranges))
+            return _join_ranges(ranges)
         else:
             display_count = max_display // 2
-            first_ranges = ranges[:display_count]
-            last_ranges = ranges[-display_count:]
-            first_str = ', '.join((f'{start}-{end}' if start != end else str(start) for (start, end) in first_ranges))
-            last_str = ', '.join((f'{start}-{end}' if start != end else str(start) for (start, end) in last_ranges))
+            first_str = _join_ranges(itertools.islice(ranges, display_count))
+            last_str = _join_ranges(itertools.islice(ranges, len(ranges) - display_count, None))
             return f'{first_str} ... {last_str} ({len(ranges)} ranges total)'
 
-    def _format_gaps(self, gaps: List[int], max_display: int=20) -> str:
+    def _format_gaps(self, gaps: Union[List[int], Set[int]], max_display: int=20) -> str:
         if not gaps:
             return 'None'
         if len(gaps) <= max_display:
-            return ', '.join((str(g) for g in gaps))
+            return ', '.join((str(g) for g in (gaps if isinstance(gaps, list) else sorted(gaps))))
         else:
-            displayed = gaps[:max_display]
+            displayed = gaps[:max_display] if isinstance(gaps, list) else heapq.nsmallest(max_display, gaps)
             return f"{', '.join((str(g) for g in displayed))} ... ({len(gaps)} gaps total)"
 
-    def _get_recommendations(self, fs_runs: Set[int], artdaq_runs: Set[int], ucon_runs: Set[int]) -> List[str]:
+    def _get_recommendations(self, fs_runs: Set[int], artdaq_runs: Set[int], ucon_runs: Set[int], runs_to_import: Set[int], runs_to_migrate: Set[int]) -> List[str]:
         recommendations = []
-        runs_to_import = fs_runs - artdaq_runs
         if runs_to_import:
             count = len(runs_to_import)
             min_run = min(runs_to_import)
             max_run = max(runs_to_import)
             recommendations.append(f'Run IMPORTER: {count} run(s) on filesystem not in artdaqDB (range: {min_run}-{max_run})')
-        runs_to_migrate = artdaq_runs - ucon_runs
         if runs_to_migrate:
             count = len(runs_to_migrate)
             min_run = min(runs_to_migrate)
@@ -98,7 +97,12 @@ class Reporter:
         migrate_failures = state.parse_run_records_from_file(self._config.app.migrate_failure_log)
         return {'import_last_contiguous': import_state.get('last_contiguous_run', 0), 'migrate_last_contiguous': migrate_state.get('last_contiguous_run', 0), 'import_failures': set(import_failures), 'migrate_failures': set(migrate_failures)}
 
-    def _compare_with_state(self, fs_runs: Set[int], artdaq_runs: Set[int], ucon_runs: Set[int], state_info: dict) -> None:
+    def _log_new_runs(self, sorted_runs: List[int], last_contiguous: int) -> None:
+        idx = bisect.bisect_right(sorted_runs, last_contiguous)
+        if idx < len(sorted_runs):
+            self._logger.info('  New Runs Available:  %d run(s) since last state update (range: %d-%d)', len(sorted_runs) - idx, sorted_runs[idx], sorted_runs[-1])
+
+    def _compare_with_state(self, state_info: dict, runs_to_import: Set[int], runs_to_migrate: Set[int], sorted_fs: List[int], sorted_artdaq: List[int]) -> None:
         self._logger.info('')
         self._logger.info('=' * 70)
         self._logger.info('STATE COMPARISON')
@@ -109,69 +113,53 @@ class Reporter:
         self._logger.info('-' * 70)
         self._logger.info('  Last Contiguous Run: %d', import_last)
         if import_last > 0:
-            expected_in_artdaq = {r for r in fs_runs if r <= import_last}
-            missing_from_artdaq = expected_in_artdaq - artdaq_runs
+            missing_from_artdaq = {r for r in runs_to_import if r <= import_last}
             if missing_from_artdaq:
-                self._logger.warning('  Missing in ArtdaqDB:  %d run(s) before last contiguous (%s)', len(missing_from_artdaq), self._format_gaps(sorted(list(missing_from_artdaq)), max_display=10))
+                self._logger.warning('  Missing in ArtdaqDB:  %d run(s) before last contiguous (%s)', len(missing_from_artdaq), self._format_gaps(missing_from_artdaq, max_display=10))
             else:
                 self._logger.info('  Status:              All expected runs present in ArtdaqDB')
-            new_runs = {r for r in fs_runs if r > import_last}
-            if new_runs:
-                min_new = min(new_runs)
-                max_new = max(new_runs)
-                self._logger.info('  New Runs Available:  %d run(s) since last state update (range: %d-%d)', len(new_runs), min_new, max_new)
+            self._log_new_runs(sorted_fs, import_last)
         else:
             self._logger.info('  Status:              No import state recorded')
         if state_info['import_failures']:
-            self._logger.warning('  Failed Runs:         %d run(s) logged as failed (%s)', len(state_info['import_failures']), self._format_gaps(sorted(list(state_info['import_failures'])), max_display=10))
+            self._logger.warning('  Failed Runs:         %d run(s) logged as failed (%s)', len(state_info['import_failures']), self._format_gaps(state_info['import_failures'], max_display=10))
         migrate_last = state_info['migrate_last_contiguous']
         self._logger.info('')
         self._logger.info('MIGRATION STAGE STATE')
         self._logger.info('-' * 70)
         self._logger.info('  Last Contiguous Run: %d', migrate_last)
         if migrate_last > 0:
-            expected_in_ucon = {r for r in artdaq_runs if r <= migrate_last}
-            missing_from_ucon = expected_in_ucon - ucon_runs
+            missing_from_ucon = {r for r in runs_to_migrate if r <= migrate_last}
             if missing_from_ucon:
-                self._logger.warning('  Missing in UconDB:   %d run(s) before last contiguous (%s)', len(missing_from_ucon), self._format_gaps(sorted(list(missing_from_ucon)), max_display=10))
+                self._logger.warning('  Missing in UconDB:   %d run(s) before last contiguous (%s)', len(missing_from_ucon), self._format_gaps(missing_from_ucon, max_display=10))
             else:
                 self._logger.info('  Status:              All expected runs present in UconDB')
-            new_runs = {r for r in artdaq_runs if r > migrate_last}
-            if new_runs:
-                min_new = min(new_runs)
-                max_new = max(new_runs)
-                self._logger.info('  New Runs Available:  %d run(s) since last state update (range: %d-%d)', len(new_runs), min_new, max_new)
+            self._log_new_runs(sorted_artdaq, migrate_last)
         else:
             self._logger.info('  Status:              No migration state recorded')
         if state_info['migrate_failures']:
-            self._logger.warning('  Failed Runs:         %d run(s) logged as failed (%s)', len(state_info['migrate_failures']), self._format_gaps(sorted(list(state_info['migrate_failures'])), max_display=10))
+            self._logger.warning('  Failed Runs:         %d run(s) logged as failed (%s)', len(state_info['migrate_failures']), self._format_gaps(state_info['migrate_failures'], max_display=10))
 
     def generate_report(self, compare_state: bool=False) -> None:
         self._logger.info('=' * 70)
         self._logger.info('RUN RECORD ARCHIVER - STATUS REPORT')
         self._logger.info('=' * 70)
         self._logger.info('Querying data sources...')
-        try:
-            fs_runs = self._get_filesystem_runs()
-            self._logger.info('✓ Filesystem query complete')
-        except ArchiverError as e:
-            self._logger.error('✗ Filesystem query failed: %s', e)
-            return
-        try:
-            artdaq_runs = self._artdaq.get_archived_runs()
-            self._logger.info('✓ ArtdaqDB query complete')
-        except ArchiverError as e:
-            self._logger.error('✗ ArtdaqDB query failed: %s', e)
-            return
-        try:
-            ucon_runs = self._ucon.get_existing_runs()
-            self._logger.info('✓ UconDB query complete')
-        except ArchiverError as e:
-            self._logger.error('✗ UconDB query failed: %s', e)
-            return
-        (fs_ranges, fs_gaps) = self._compute_ranges_and_gaps(fs_runs)
-        (artdaq_ranges, artdaq_gaps) = self._compute_ranges_and_gaps(artdaq_runs)
-        (ucon_ranges, ucon_gaps) = self._compute_ranges_and_gaps(ucon_runs)
+        with ThreadPoolExecutor(max_workers=3, thread_name_prefix='ReportQuery') as executor:
+            queries = [('Filesystem', executor.submit(self._get_filesystem_runs)), ('ArtdaqDB', executor.submit(self._artdaq.get_archived_runs)), ('UconDB', executor.submit(self._ucon.get_existing_runs))]
+            results: List[Set[int]] = []
+            for (source, future) in queries:
+                try:
+                    results.append(future.result())
+                    self._logger.info('✓ %s query complete', source)
+                except ArchiverError as e:
+                    self._logger.error('✗ %s query failed: %s', source, e)
+                    return
+        (fs_runs, artdaq_runs, ucon_runs) = results
+        (sorted_fs, sorted_artdaq, sorted_ucon) = (sorted(fs_runs), sorted(artdaq_runs), sorted(ucon_runs))
+        (fs_ranges, fs_gaps) = self._compute_ranges_and_gaps(sorted_fs)
+        (artdaq_ranges, artdaq_gaps) = self._compute_ranges_and_gaps(sorted_artdaq)
+        (ucon_ranges, ucon_gaps) = self._compute_ranges_and_gaps(sorted_ucon)
         self._logger.info('')
         self._logger.info('=' * 70)
         self._logger.info('DATA SOURCE SUMMARY')
@@ -182,7 +170,7 @@ class Reporter:
         self._logger.info('  Location:        %s', self._config.source_files.run_records_dir)
         self._logger.info('  Total Runs:      %d', len(fs_runs))
         if fs_runs:
-            self._logger.info('  Range:           %d to %d', min(fs_runs), max(fs_runs))
+            self._logger.info('  Range:           %d to %d', sorted_fs[0], sorted_fs[-1])
             self._logger.info('  Contiguous:      %s', self._format_ranges(fs_ranges))
             self._logger.info('  Gaps:            %s', self._format_gaps(fs_gaps))
         else:
@@ -193,7 +181,7 @@ class Reporter:
         self._logger.info('  Database URI:    %s', self._config.artdaq_db.database_uri)
         self._logger.info('  Total Runs:      %d', len(artdaq_runs))
         if artdaq_runs:
-            self._logger.info('  Range:           %d to %d', min(artdaq_runs), max(artdaq_runs))
+            self._logger.info('  Range:           %d to %d', sorted_artdaq[0], sorted_artdaq[-1])
             self._logger.info('  Contiguous:      %s', self._format_ranges(artdaq_ranges))
             self._logger.info('  Gaps:            %s', self._format_gaps(artdaq_gaps))
         else:
@@ -205,15 +193,16 @@ class Reporter:
         self._logger.info('  Folder/Object:   %s/%s', self._config.ucon_db.folder_name, self._config.ucon_db.object_name)
         self._logger.info('  Total Runs:      %d', len(ucon_runs))
         if ucon_runs:
-            self._logger.info('  Range:           %d to %d', min(ucon_runs), max(ucon_runs))
+            self._logger.info('  Range:           %d to %d', sorted_ucon[0], sorted_ucon[-1])
             self._logger.info('  Contiguous:      %s', self._format_ranges(ucon_ranges))
             self._logger.info('  Gaps:            %s', self._format_gaps(ucon_gaps))
         else:
             self._logger.info('  Status:          No runs found')
+        (runs_to_import, runs_to_migrate) = (fs_runs - artdaq_runs, artdaq_runs - ucon_runs)
         if compare_state:
             state_info = self._get_state_info()
-            self._compare_with_state(fs_runs, artdaq_runs, ucon_runs, state_info)
-        recommendations = self._get_recommendations(fs_runs, artdaq_runs, ucon_runs)
+            self._compare_with_state(state_info, runs_to_import, runs_to_migrate, sorted_fs, sorted_artdaq)
+        recommendations = self._get_recommendations(fs_runs, artdaq_runs, ucon_runs, runs_to_import, runs_to_migrate)
         self._logger.info('')
         self._logger.info('=' * 70)
         self._logger.info('RECOMMENDATIONS')
@@ -1,50 +1,74 @@
-import locale
+import io
 import logging
+import os
 import re
 import time
 from pathlib import Path
-from typing import Dict, List
+from typing import Dict, List, Optional
 from ..exceptions import BlobCreationError
+from ..utils import scan_files_recursive
+_FILE_MARKER_RE = re.compile('\\n#####\\n(.+?):\\n#####\\n')
+_END_RECORD_RE = re.compile('\\nEnd of Record\\n')
+_MONTH_ABBREVIATIONS = ('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec')
+_END_FILES_ORDER = ('boot.fcl', 'known_boardreaders_list.fcl', 'setup.fcl', 'environment.fcl', 'metadata.fcl', 'settings.fcl', 'ranks.fcl', 'RunHistory.fcl', 'RunHistory2.fcl')
+_END_FILES_INDEX = {name.lower(): idx for (idx, name) in enumerate(_END_FILES_ORDER)}
+
+def _read_file(path: str) -> bytes:
+    fd = os.open(path, os.O_RDONLY | os.O_CLOEXEC)
+    try:
+        size = os.fstat(fd).st_size
+        content = os.read(fd, size + 1)
+        if len(content) <= size:
+            return content
+        chunks = [content]
+        while (chunk := os.read(fd, 65536)):
+            chunks.append(chunk)
+        return b''.join(chunks)
+    finally:
+        os.close(fd)
 
 class BlobCreator:
 
     def __init__(self) -> None:
         self._logger = logging.getLogger(__name__)
 
-    def create_blob_from_directory(self, run_number: int, source_dir: Path) -> str:
+    def create_blob_from_directory(self, run_number: int, source_dir: Path) -> bytes:
         self._logger.debug("Creating blob for run %d from '%s'.", run_number, source_dir)
         try:
-            all_files: List[Path] = [p for p in source_dir.rglob('*') if p.is_file()]
+            all_files: List[os.DirEntry] = list(scan_files_recursive(str(source_dir)))
             if not all_files:
                 raise BlobCreationError(f'No config files found in {source_dir} for run {run_number}.')
-            end_files_order = ['boot.fcl', 'known_boardreaders_list.fcl', 'setup.fcl', 'environment.fcl', 'metadata.fcl', 'settings.fcl', 'ranks.fcl', 'RunHistory.fcl', 'RunHistory2.fcl']
-            file_map = {p.name.lower(): p for p in all_files}
-            end_files = []
-            for end_file in end_files_order:
-                if end_file.lower() in file_map:
-                    end_files.append(file_map[end_file.lower()])
-                    del file_map[end_file.lower()]
-            regular_files = sorted(file_map.values(), key=lambda p: p.name.lower())
-            files = regular_files + end_files
-            old_locale = locale.setlocale(locale.LC_TIME)
-            try:
-                locale.setlocale(locale.LC_TIME, 'C')
-                timestamp = time.strftime('%b %d %H:%M', time.gmtime()) + ' UTC'
-            finally:
-                locale.setlocale(locale.LC_TIME, old_locale)
+            end_files: List[Optional[os.DirEntry]] = [None] * len(_END_FILES_ORDER)
+            regular_files: Dict[str, os.DirEntry] = {}
+            for entry in all_files:
+                name = entry.name.lower()
+                idx = _END_FILES_INDEX.get(name)
+                if idx is None:
+                    regular_files[name] = entry
+                else:
+                    end_files[idx] = entry
+            files = [regular_files[name] for name in sorted(regular_files)] + [entry for entry in end_files if entry is not None]
+            now = time.gmtime()
+            timestamp = f'{_MONTH_ABBREVIATIONS[now.tm_mon - 1]} {now.tm_mday:02d} {now.tm_hour:02d}:{now.tm_min:02d} UTC'
             header = f'Start of Record\nRun Number: {run_number}\nPacked on {timestamp}\n'
             footer = f'\nEnd of Record\nRun Number: {run_number}\nPacked on {timestamp}\n'
-            content_parts = [header]
-            for file_path in files:
-                filename = file_path.name
-                content_parts.append(f'\n#####\n{filename}:\n#####\n')
-                try:
-                    content_parts.append(file_path.read_text(encoding='utf-8'))
-                except UnicodeDecodeError:
-                    self._logger.warning("File '%s' not UTF-8, reading as binary.", file_path)
-                    content_parts.append(file_path.read_bytes().decode('ascii', 'ignore'))
-            content_parts.append(footer)
-            return ''.join(content_parts)
+            buf = io.BytesIO()
+            buf.write(header.encode('utf-8'))
+            for entry in files:
+                buf.write(f'\n#####\n{entry.name}:\n#####\n'.encode('utf-8'))
+                content = _read_file(entry.path)
+                if not content.isascii():
+                    try:
+                        content.decode('utf-8')
+                    except UnicodeDecodeError:
+                        self._logger.warning("File '%s' not UTF-8, reading as binary.", entry.path)
+                        buf.write(content.decode('ascii', 'ignore').encode('ascii'))
+                        continue
+                if b'\r' in content:
+                    content = content.replace(b'\r\n', b'\n').replace(b'\r', b'\n')
+                buf.write(content)
+            buf.write(footer.encode('utf-8'))
+            return buf.getvalue()
         except Exception as e:
             raise BlobCreationError(f'Error creating blob for run {run_number}: {e}') from e
 
@@ -52,29 +76,25 @@ class BlobCreator:
         self._logger.debug("Extracting files from blob to '%s'.", output_dir)
         try:
             output_dir.mkdir(parents=True, exist_ok=True)
-            pattern = '\\n#####\\n(.+?):\\n#####\\n'
-            matches = list(re.finditer(pattern, blob))
-            if not matches:
-                raise BlobCreationError('No file markers found in blob')
             extracted_files: Dict[str, Path] = {}
-            for (i, match) in enumerate(matches):
-                filename = match.group(1)
-                content_start = match.end()
-                if i + 1 < len(matches):
-                    content_end = matches[i + 1].start()
-                else:
-                    footer_match = re.search('\\nEnd of Record\\n', blob[content_start:])
-                    if footer_match:
-                        content_end = content_start + footer_match.start()
-                    else:
-                        content_end = len(blob)
-                content = blob[content_start:content_end]
-                file_path = output_dir / filename
-                file_path.parent.mkdir(parents=True, exist_ok=True)
-                file_path.write_text(content, encoding='utf-8')
-                extracted_files[filename] = file_path
-                self._logger.debug('Extracted file: %s', filename)
+            (filename, content_start) = (None, 0)
+            for match in _FILE_MARKER_RE.finditer(blob):
+                if filename is not None:
+                    self._write_extracted_file(output_dir, filename, blob[content_start:match.start()], extracted_files)
+                (filename, content_start) = (match.group(1), match.end())
+            if filename is None:
+                raise BlobCreationError('No file markers found in blob')
+            footer_match = _END_RECORD_RE.search(blob, content_start)
+            self._write_extracted_file(output_dir, filename, blob[content_start:footer_match.start() if footer_match else len(blob)], extracted_files)
             self._logger.info('Extracted %d files from blob', len(extracted_files))
             return extracted_files
         except Exception as e:
-            raise BlobCreationError(f'Error extracting files from blob: {e}') from e
\ No newline at end of file
+            raise BlobCreationError(f'Error extracting files from blob: {e}') from e
+
+    def _write_extracted_file(self, output_dir: Path, filename: str, content: str, extracted_files: Dict[str, Path]) -> None:
+        file_path = output_dir / filename
+        if '/' in filename:
+            file_path.parent.mkdir(parents=True, exist_ok=True)
+        file_path.write_text(content, encoding='utf-8')
+        extracted_files[filename] = file_path
+        self._logger.debug('Extracted file: %s', filename)
\ No newline at end of file
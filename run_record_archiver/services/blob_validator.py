@@ -1,6 +1,7 @@
 import logging
 import re
 from typing import Dict, Tuple
+_BLOB_FILE_RE = re.compile('#####\\n(.+?):\\n#####\\n([\\s\\S]*?)(?=(?:\\n#####)|(?:\\nEnd of Record))')
 DEFAULT_PARAMETER_SPEC = {'metadata.fcl': {'components': 'components', 'configuration': 'config_name', 'projectversion': 'sbndaq_commit_or_version'}}
 
 class BlobValidator:
@@ -11,8 +12,7 @@ class BlobValidator:
 
     def unpack_blob(self, blob: str) -> Dict[str, str]:
         files = {}
-        pattern = re.compile('#####\\n(.+?):\\n#####\\n([\\s\\S]*?)(?=(?:\\n#####)|(?:\\nEnd of Record))')
-        for match in pattern.finditer(blob):
+        for match in _BLOB_FILE_RE.finditer(blob):
             filename = match.group(1)
             content = match.group(2)
             files[filename] = content
@@ -1,11 +1,44 @@
+import errno
 import logging
+import os
 import re
 import shutil
+import threading
 from pathlib import Path
-from typing import Callable, Dict, List, Optional, Set
+from typing import Callable, Dict, List, Optional, Set, Tuple
 from ..config import FhiclizeGenerateConfig
 from ..exceptions import FclPreperationError
 from ..fhiclutils import fhiclize_known_boardreaders_list, fhiclize_metadata, fhiclize_boot, fhiclize_settings, fhiclize_setup, fhiclize_environment, fhiclize_ranks, generate_run_history
+from ..utils import scan_files_recursive
+_KV_RE = re.compile('^[^\\S\\n]*([^#:\\s][^:\\n]*):(.*)$', re.MULTILINE)
+_KEY_TRANS = str.maketrans(dict.fromkeys('\t\n\x0b\x0c\r\x1c\x1d\x1e\x1f \x85\xa0\u1680\u2000\u2001\u2002\u2003\u2004\u2005\u2006\u2007\u2008\u2009\u200a\u2028\u2029\u202f\u205f\u3000()/#.-', '_'))
+_EXPORT_RE = re.compile('^[^\\S\\n]*export[^\\S\\n]+([A-Za-z_][A-Za-z0-9_]*)[^\\S\\n]*=(.*)$', re.MULTILINE)
+_CONFIG_NAME_RE = re.compile('^Config name:[^\\S\\n]+(.*)', re.MULTILINE)
+_DAQ_TIME_RE = re.compile('^DAQInterface (stop|start) time:[^\\S\\n]+([^\\r\\n]*)', re.MULTILINE)
+_NON_ASCII_RE = re.compile('[^\x00-\x7f]')
+_LINK_FALLBACK_ERRNOS = frozenset((errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP))
+
+def _sanitize_ascii(text: str) -> str:
+    if text.isascii():
+        return text
+    return _NON_ASCII_RE.sub('.', text)
+
+def _link_or_copy(src: Path, dst: Path) -> None:
+    try:
+        os.link(src, dst)
+    except FileExistsError:
+        os.unlink(dst)
+        _link_or_copy(src, dst)
+    except OSError as e:
+        if e.errno not in _LINK_FALLBACK_ERRNOS:
+            raise
+        shutil.copy(src, dst)
+
+def _clone_run_file(src: str, dst: str) -> None:
+    if os.stat(src).st_mode & 511 == 420:
+        _link_or_copy(Path(src), Path(dst))
+    else:
+        shutil.copy2(src, dst)
 
 class FclPreparer:
 
@@ -15,95 +48,92 @@ class FclPreparer:
         if not self.fcl_conf_dir.is_dir():
             raise FclPreperationError(f"FCL confdir '{self.fcl_conf_dir}' is not a directory.")
         self.fhiclize_config = fhiclize_config or FhiclizeGenerateConfig(None)
+        self._metadata = threading.local()
         self._converter_map: Dict[str, Callable[[str], str]] = {'metadata': fhiclize_metadata, 'boot': fhiclize_boot, 'known_boardreaders_list': fhiclize_known_boardreaders_list, 'settings': fhiclize_settings, 'setup': fhiclize_setup, 'environment': fhiclize_environment, 'ranks': fhiclize_ranks}
 
     def prepare_fcl_for_archive(self, run_dir: Path, tmpdir_path: Path) -> str:
+        self._metadata.entry = None
         try:
-            shutil.copytree(run_dir, tmpdir_path, dirs_exist_ok=True)
+            conversions: List[Tuple[os.DirEntry, str, Callable[[str], str]]] = []
+            with os.scandir(run_dir) as entries:
+                for entry in entries:
+                    if entry.name.endswith('.txt') and entry.is_file():
+                        basename = entry.name[:-4]
+                        if self.fhiclize_config.should_convert(basename):
+                            converter = self._converter_map.get(basename)
+                            if converter:
+                                conversions.append((entry, basename, converter))
+                                continue
+                            self._logger.warning('No converter found for configured file: %s', basename)
+                        else:
+                            self._logger.debug('Skipping %s (not in fhiclize_generate config)', entry.name)
+                    if entry.is_dir():
+                        shutil.copytree(entry.path, tmpdir_path / entry.name, dirs_exist_ok=True, copy_function=_clone_run_file)
+                    else:
+                        _clone_run_file(entry.path, str(tmpdir_path / entry.name))
             tmpdir_path.chmod(493)
-            for path in tmpdir_path.rglob('*'):
-                if path.is_file():
-                    path.chmod(420)
+            for entry in scan_files_recursive(str(tmpdir_path)):
+                if entry.stat().st_mode & 511 != 420:
+                    os.chmod(entry.path, 420)
             run_number = None
             try:
                 run_number = int(run_dir.name)
             except ValueError:
                 pass
-            for src_path in tmpdir_path.glob('*.txt'):
-                basename = src_path.stem
-                if self.fhiclize_config.should_convert(basename):
-                    converter = self._converter_map.get(basename)
-                    if converter:
-                        fcl_name = basename + '.fcl'
-                        dest_path = tmpdir_path / fcl_name
-                        content = src_path.read_text(encoding='utf-8')
-                        dest_path.write_text(converter(content), encoding='utf-8')
-                        src_path.unlink()
-                        self._logger.debug('Converted %s to %s', src_path.name, fcl_name)
-                    else:
-                        self._logger.warning('No converter found for configured file: %s', basename)
-                else:
-                    self._logger.debug('Skipping %s (not in fhiclize_generate config)', src_path.name)
+            for (entry, basename, converter) in conversions:
+                fcl_name = basename + '.fcl'
+                dest_path = tmpdir_path / fcl_name
+                content = self._read_metadata(run_dir) if basename == 'metadata' else Path(entry.path).read_text(encoding='utf-8')
+                dest_path.unlink(missing_ok=True)
+                dest_path.write_text(converter(content), encoding='utf-8')
+                self._logger.debug('Converted %s to %s', entry.name, fcl_name)
             if self.fhiclize_config.should_generate('RunHistory'):
-                metadata_txt = run_dir / 'metadata.txt'
-                if metadata_txt.exists():
-                    metadata_content = metadata_txt.read_text(encoding='utf-8')
+                metadata_content = self._read_metadata(run_dir)
+                if metadata_content is not None:
                     runhistory_content = generate_run_history(metadata_content, run_number)
-                    (tmpdir_path / 'RunHistory.fcl').write_text(runhistory_content, encoding='utf-8')
+                    runhistory_path = tmpdir_path / 'RunHistory.fcl'
+                    runhistory_path.unlink(missing_ok=True)
+                    runhistory_path.write_text(runhistory_content, encoding='utf-8')
                     self._logger.debug('Generated RunHistory.fcl from metadata.txt')
                 else:
                     self._logger.warning('Cannot generate RunHistory.fcl: metadata.txt not found in run directory')
-            schema_src = self.fcl_conf_dir / 'schema.fcl'
-            if not schema_src.is_file():
-                raise FclPreperationError(f'Schema not found at {schema_src}')
-            shutil.copy(schema_src, tmpdir_path)
+            self._stage_schema(tmpdir_path)
             return self._resolve_config_name(run_dir)
         except (IOError, shutil.Error) as e:
             raise FclPreperationError(f'Error preparing FCL for archive: {e}') from e
+        finally:
+            self._metadata.entry = None
 
     def prepare_fcl_for_update(self, run_dir: Path, tmpdir_path: Path) -> bool:
         try:
             if not self.fhiclize_config.should_generate('RunHistory2'):
                 self._logger.debug('RunHistory2 not in fhiclize_generate config, skipping update')
                 return False
-            rh2_content = []
-            if (metadata_path := (run_dir / 'metadata.txt')).exists():
-                for line in metadata_path.read_text(encoding='utf-8').splitlines():
-                    match = re.search('^DAQInterface stop time:\\s+(.*)', line)
-                    if match:
-                        stop_time_value = match.group(1)
-                        rh2_content.append(f'DAQInterface_stop_time: "{stop_time_value}"')
-                    match = re.search('^DAQInterface start time:\\s+(.*)', line)
-                    if match:
-                        start_time_value = match.group(1)
-                        rh2_content.append(f'DAQInterface_start_time: "{start_time_value}"')
+            rh2_content = [f'DAQInterface_{kind}_time: "{value}"' for (kind, value) in self._scan_daq_times(run_dir)]
             if not rh2_content:
                 self._logger.debug('No stop-time found for run %s, skipping update', run_dir.name)
                 return False
-            cleaned_lines = [''.join((c if ord(c) < 128 else '.' for c in line)) for line in rh2_content]
+            cleaned_lines = [_sanitize_ascii(line) for line in rh2_content]
             (tmpdir_path / 'RunHistory2.fcl').write_text('\n'.join(cleaned_lines), encoding='utf-8')
             self._logger.debug('Generated RunHistory2.fcl for update')
-            schema_src = self.fcl_conf_dir / 'schema.fcl'
-            if not schema_src.is_file():
-                raise FclPreperationError(f'Schema not found at {schema_src}')
-            shutil.copy(schema_src, tmpdir_path)
+            self._stage_schema(tmpdir_path)
             return True
         except IOError as e:
             raise FclPreperationError(f'Error preparing FCL for update: {e}') from e
 
+    def _stage_schema(self, tmpdir_path: Path) -> None:
+        schema_src = self.fcl_conf_dir / 'schema.fcl'
+        if not schema_src.is_file():
+            raise FclPreperationError(f'Schema not found at {schema_src}')
+        _link_or_copy(schema_src, tmpdir_path / 'schema.fcl')
+
     def _fhiclize_document(self, filepath: Path) -> str:
         fhiclized_lines: List[str] = []
         try:
-            for line in filepath.read_text(encoding='utf-8').splitlines():
-                line = line.strip()
-                if not line or line.startswith('#'):
-                    continue
-                if (match := re.match('^([^:]+?)\\s*:\\s*(.*)', line)):
-                    (key, value) = match.groups()
-                    key = re.sub('[\\s()/#.\\-]', '_', key.strip())
-                    value = value.strip().strip('\'"').replace('"', '\\"')
-                    value = ''.join((c if ord(c) < 128 else '.' for c in value))
-                    fhiclized_lines.append(f'{key}: "{value}"')
+            for (key, value) in _KV_RE.findall(filepath.read_text(encoding='utf-8')):
+                key = key.strip().translate(_KEY_TRANS)
+                value = value.strip().strip('\'"').replace('"', '\\"')
+                fhiclized_lines.append(f'{key}: "{_sanitize_ascii(value)}"')
         except IOError as e:
             raise FclPreperationError(f'Could not FHiCLize {filepath}: {e}') from e
         return '\n'.join(fhiclized_lines)
@@ -111,15 +141,9 @@ class FclPreparer:
     def _fhiclize_environment(self, filepath: Path) -> str:
         fhiclized_lines: List[str] = []
         try:
-            for line in filepath.read_text(encoding='utf-8').splitlines():
-                line = line.strip()
-                if not line or line.startswith('#'):
-                    continue
-                if (match := re.match('^export\\s+([A-Za-z_][A-Za-z0-9_]*)\\s*=\\s*(.*)$', line)):
-                    (key, value) = match.groups()
-                    value = value.strip().strip('\'"').replace('"', '\\"')
-                    value = ''.join((c if ord(c) < 128 else '.' for c in value))
-                    fhiclized_lines.append(f'{key}: "{value}"')
+            for (key, value) in _EXPORT_RE.findall(filepath.read_text(encoding='utf-8')):
+                value = value.strip().strip('\'"').replace('"', '\\"')
+                fhiclized_lines.append(f'{key}: "{_sanitize_ascii(value)}"')
         except IOError as e:
             raise FclPreperationError(f'Could not FHiCLize environment file {filepath}: {e}') from e
         return '\n'.join(fhiclized_lines)
@@ -127,7 +151,7 @@ class FclPreparer:
     def _fhiclize_tabular(self, filepath: Path) -> str:
         try:
             content = filepath.read_text(encoding='utf-8')
-            content = ''.join((c if ord(c) < 128 else '.' for c in content))
+            content = _sanitize_ascii(content)
             content = content.replace('\\', '\\\\').replace('"', '\\"')
             content = content.replace('\n', '\\n')
             key = filepath.stem
@@ -135,14 +159,34 @@ class FclPreparer:
         except IOError as e:
             raise FclPreperationError(f'Could not FHiCLize tabular file {filepath}: {e}') from e
 
-    def _resolve_config_name(self, run_dir: Path) -> str:
+    def _read_metadata(self, run_dir: Path) -> Optional[str]:
+        entry = getattr(self._metadata, 'entry', None)
+        if entry is not None and entry[0] == run_dir:
+            return entry[1]
         metadata_file = run_dir / 'metadata.txt'
-        if metadata_file.exists():
-            try:
-                for line in metadata_file.read_text(encoding='utf-8').splitlines():
-                    if (match := re.match('^Config name:\\s+(.*)', line)):
-                        if (name := match.group(1).strip()):
-                            return name.replace('/', '_')
-            except IOError as e:
-                self._logger.warning('Could not read metadata file %s: %s', run_dir, e)
+        content = metadata_file.read_text(encoding='utf-8') if metadata_file.exists() else None
+        self._metadata.entry = (run_dir, content)
+        return content
+
+    def _scan_daq_times(self, run_dir: Path) -> List[Tuple[str, str]]:
+        times: List[Tuple[str, str]] = []
+        try:
+            with (run_dir / 'metadata.txt').open('r', encoding='utf-8', buffering=65536) as f:
+                for line in f:
+                    if line.startswith('DAQInterface st') and (match := _DAQ_TIME_RE.match(line)):
+                        times.append(match.groups())
+        except FileNotFoundError:
+            pass
+        return times
+
+    def _resolve_config_name(self, run_dir: Path) -> str:
+        try:
+            metadata_content = self._read_metadata(run_dir)
+        except IOError as e:
+            self._logger.warning('Could not read metadata file %s: %s', run_dir, e)
+            return 'standard'
+        if metadata_content is not None and 'Config name:' in metadata_content:
+            for match in _CONFIG_NAME_RE.finditer(metadata_content):
+                if (name := match.group(1).strip()):
+                    return name.replace('/', '_')
         return 'standard'
\ No newline at end of file
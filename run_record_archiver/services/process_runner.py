@@ -2,79 +2,127 @@ import logging
 import os
 import shlex
 import subprocess
+import tempfile
+import threading
+import time
 from pathlib import Path
-from typing import Optional
+from typing import IO, Dict, List, Optional
+from ..constants import PROCESS_RUNNER_OUTPUT_CAPTURE_BYTES, PROCESS_RUNNER_TIMEOUT_SECONDS, SSH_CONTROL_PATH, SSH_CONTROL_PERSIST_SECONDS, SSH_MASTER_START_TIMEOUT_SECONDS
 from ..exceptions import ArtdaqDBError
+_LIB_DIR = Path(__file__).parent.parent.parent.resolve() / 'lib'
+_ENV_KEYS = ('LD_LIBRARY_PATH', 'PYTHONPATH', 'ARTDAQ_DATABASE_DATADIR', 'ARTDAQ_DATABASE_CONFDIR')
+_LOCAL_THREADS = str(max(1, (os.cpu_count() or 2) // 2))
+_SSH_OPTIONS = ['-o', 'StrictHostKeyChecking=no', '-o', 'UserKnownHostsFile=/dev/null', '-o', 'BatchMode=yes']
+_SSH_MUX_OPTIONS = ['-o', 'ControlMaster=auto', '-o', f'ControlPath={SSH_CONTROL_PATH}', '-o', f'ControlPersist={SSH_CONTROL_PERSIST_SECONDS}']
+_ssh_masters: Dict[str, bool] = {}
+_ssh_masters_lock = threading.Lock()
 
-def run_bulkloader(run_number: int, config_name: str, data_dir: Path, archive_uri: str, remote_host: Optional[str]) -> None:
+def _read_capture(capture: IO[bytes]) -> str:
+    size = capture.seek(0, os.SEEK_END)
+    capture.seek(0)
+    if size <= PROCESS_RUNNER_OUTPUT_CAPTURE_BYTES:
+        return capture.read().decode('utf-8', 'replace')
+    half = PROCESS_RUNNER_OUTPUT_CAPTURE_BYTES // 2
+    head = capture.read(half)
+    capture.seek(size - half)
+    return f"{head.decode('utf-8', 'replace')}\n... [{size - 2 * half} bytes omitted] ...\n{capture.read().decode('utf-8', 'replace')}"
+
+def start_ssh_master(remote_host: str) -> bool:
+    logger = logging.getLogger(__name__)
+    try:
+        Path(SSH_CONTROL_PATH).expanduser().parent.mkdir(mode=448, parents=True, exist_ok=True)
+    except OSError as e:
+        logger.warning('Could not create SSH control socket directory for %s: %s', remote_host, e)
+        return False
+    with tempfile.TemporaryFile() as stderr:
+        try:
+            returncode = subprocess.run(['ssh', *_SSH_OPTIONS, *_SSH_MUX_OPTIONS, remote_host, 'true'], stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=stderr, timeout=SSH_MASTER_START_TIMEOUT_SECONDS).returncode
+        except (OSError, subprocess.TimeoutExpired) as e:
+            logger.warning('Could not open shared SSH connection to %s: %s', remote_host, e)
+            return False
+        if returncode != 0:
+            logger.warning('Could not open shared SSH connection to %s (code %d): %s', remote_host, returncode, _read_capture(stderr).strip())
+            return False
+    logger.debug('Shared SSH connection to %s ready (idle timeout %ds)', remote_host, SSH_CONTROL_PERSIST_SECONDS)
+    return True
+
+def _ssh_command(remote_host: str) -> List[str]:
+    with _ssh_masters_lock:
+        multiplexed = _ssh_masters.get(remote_host)
+        if multiplexed is None:
+            multiplexed = _ssh_masters[remote_host] = start_ssh_master(remote_host)
+    return ['ssh', *_SSH_OPTIONS, *_SSH_MUX_OPTIONS, remote_host] if multiplexed else ['ssh', *_SSH_OPTIONS, remote_host]
+
+def _abort_processes(processes: List[subprocess.Popen]) -> None:
+    for process in processes:
+        process.kill()
+        process.wait()
+        if process.stdout is not None:
+            process.stdout.close()
+
+def _run_pipeline(tool: str, commands: List[List[str]], env: Optional[Dict[str, str]]=None, cwd: Optional[Path]=None) -> None:
     logger = logging.getLogger(__name__)
-    project_root = Path(__file__).parent.parent.parent.resolve()
-    lib_dir = project_root / 'lib'
-    env_keys = ['LD_LIBRARY_PATH', 'PYTHONPATH', 'ARTDAQ_DATABASE_DATADIR', 'ARTDAQ_DATABASE_CONFDIR']
-    set_env_parts = [f'export {k}="{os.environ[k]}"' for k in env_keys if k in os.environ]
+    cmd = ' | '.join((shlex.join(argv) for argv in commands))
+    logger.debug('Executing %s command: %s', tool.lower(), cmd)
+    processes: List[subprocess.Popen] = []
+    with tempfile.TemporaryFile() as stdout, tempfile.TemporaryFile() as stderr:
+        try:
+            stdin = None
+            for (index, argv) in enumerate(commands):
+                last = index == len(commands) - 1
+                process = subprocess.Popen(argv, stdin=stdin, stdout=stdout if last else subprocess.PIPE, stderr=stderr, env=env, cwd=cwd)
+                if stdin is not None:
+                    stdin.close()
+                stdin = process.stdout
+                processes.append(process)
+            deadline = time.monotonic() + PROCESS_RUNNER_TIMEOUT_SECONDS
+            returncodes = [process.wait(timeout=max(0.0, deadline - time.monotonic())) for process in processes]
+        except subprocess.TimeoutExpired as e:
+            _abort_processes(processes)
+            error_message = f'{tool} timed out.\nStdout: {_read_capture(stdout)}\nStderr: {_read_capture(stderr)}'
+            logger.error(error_message)
+            raise ArtdaqDBError(error_message) from e
+        except OSError as e:
+            _abort_processes(processes)
+            error_message = f'{tool} could not be started: {e}\nCmd: {cmd}'
+            logger.error(error_message)
+            raise ArtdaqDBError(error_message) from e
+        returncode = next((code for code in reversed(returncodes) if code != 0), 0)
+        if returncode != 0:
+            error_message = f'{tool} failed with code {returncode}.\nCmd: {cmd}\nStdout: {_read_capture(stdout)}\nStderr: {_read_capture(stderr)}'
+            logger.error(error_message)
+            raise ArtdaqDBError(error_message)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('%s stdout:\n%s', tool, _read_capture(stdout))
+        if (stderr_text := _read_capture(stderr)):
+            logger.warning('%s stderr:\n%s', tool, stderr_text)
+
+def _tool_environment(archive_uri: str) -> Dict[str, str]:
     current_path = os.environ.get('PATH', '')
-    extended_path = f'{lib_dir}:{current_path}' if current_path else str(lib_dir)
-    set_env_parts.insert(0, f'export PATH="{extended_path}"')
-    set_env_parts.append(f'export ARTDAQ_DATABASE_URI="{archive_uri}"')
-    set_env_command = '; '.join(set_env_parts)
-    num_threads = '$(( $(nproc)/2 ))'
+    environment = {'PATH': f'{_LIB_DIR}:{current_path}' if current_path else str(_LIB_DIR)}
+    environment.update(((k, os.environ[k]) for k in _ENV_KEYS if k in os.environ))
+    environment['ARTDAQ_DATABASE_URI'] = archive_uri
+    return environment
+
+def _remote_env_command(archive_uri: str) -> str:
+    return '; '.join((f'export {k}="{v}"' for (k, v) in _tool_environment(archive_uri).items()))
+
+def _remote_script(remote_tmpdir: str, *steps: str) -> str:
+    return '; '.join(('set -e', f'd={shlex.quote(remote_tmpdir)}', 'trap \'cd /; rm -rf "$d"\' EXIT', "trap 'exit 1' HUP INT TERM", 'mkdir -p "$d"', *steps))
+
+def run_bulkloader(run_number: int, config_name: str, data_dir: Path, archive_uri: str, remote_host: Optional[str]) -> None:
     if remote_host:
-        sshopts = '-o "StrictHostKeyChecking=no" -o "UserKnownHostsFile=/dev/null" -o "BatchMode=yes"'
         remote_tmpdir = f'/tmp/bulkloader_{run_number}_{os.getpid()}'
-        bulkloader_cmd = f'bulkloader -r {run_number} -c {shlex.quote(config_name)} -p {shlex.quote(remote_tmpdir)} -t {num_threads}'
-        remote_script = f'mkdir -p {shlex.quote(remote_tmpdir)}; cd {shlex.quote(remote_tmpdir)}; tar xzf -; {set_env_command}; {bulkloader_cmd}; cd /; rm -rf {shlex.quote(remote_tmpdir)}'
-        command_to_run = f'tar czf - -C {shlex.quote(str(data_dir))} . | ssh {sshopts} {shlex.quote(remote_host)} {shlex.quote(remote_script)}'
+        remote_script = _remote_script(remote_tmpdir, 'cd "$d"', 'tar xzf -', _remote_env_command(archive_uri), f'bulkloader -r {run_number} -c {shlex.quote(config_name)} -p "$d" -t $(( $(nproc)/2 ))')
+        _run_pipeline('Bulkloader', [['tar', 'czf', '-', '-C', str(data_dir), '.'], [*_ssh_command(remote_host), remote_script]])
     else:
-        bulkloader_cmd = f'bulkloader -r {run_number} -c {shlex.quote(config_name)} -p {shlex.quote(str(data_dir))} -t {num_threads}'
-        command_to_run = f'{set_env_command}; cd {shlex.quote(str(data_dir))}; {bulkloader_cmd}'
-    try:
-        logger.debug('Executing bulkloader command: %s', command_to_run)
-        result = subprocess.run(command_to_run, shell=True, check=True, capture_output=True, text=True, timeout=300)
-        logger.debug('Bulkloader stdout:\n%s', result.stdout)
-        if result.stderr:
-            logger.warning('Bulkloader stderr:\n%s', result.stderr)
-    except subprocess.CalledProcessError as e:
-        error_message = f'Bulkloader failed with code {e.returncode}.\nCmd: {e.cmd}\nStdout: {e.stdout}\nStderr: {e.stderr}'
-        logger.error(error_message)
-        raise ArtdaqDBError(error_message) from e
-    except subprocess.TimeoutExpired as e:
-        error_message = f'Bulkloader timed out.\nStdout: {e.stdout}\nStderr: {e.stderr}'
-        logger.error(error_message)
-        raise ArtdaqDBError(error_message) from e
+        _run_pipeline('Bulkloader', [['bulkloader', '-r', str(run_number), '-c', config_name, '-p', str(data_dir), '-t', _LOCAL_THREADS]], env={**os.environ, **_tool_environment(archive_uri)}, cwd=data_dir)
 
 def run_bulkdownloader(run_number: int, config_name: str, destination_dir: Path, archive_uri: str, remote_host: Optional[str]) -> None:
-    logger = logging.getLogger(__name__)
-    project_root = Path(__file__).parent.parent.parent.resolve()
-    lib_dir = project_root / 'lib'
-    env_keys = ['LD_LIBRARY_PATH', 'PYTHONPATH', 'ARTDAQ_DATABASE_DATADIR', 'ARTDAQ_DATABASE_CONFDIR']
-    set_env_parts = [f'export {k}="{os.environ[k]}"' for k in env_keys if k in os.environ]
-    current_path = os.environ.get('PATH', '')
-    extended_path = f'{lib_dir}:{current_path}' if current_path else str(lib_dir)
-    set_env_parts.insert(0, f'export PATH="{extended_path}"')
-    set_env_parts.append(f'export ARTDAQ_DATABASE_URI="{archive_uri}"')
-    set_env_command = '; '.join(set_env_parts)
-    num_threads = '$(( $(nproc)/2 ))'
     destination_dir.mkdir(parents=True, exist_ok=True)
     if remote_host:
-        sshopts = '-o "StrictHostKeyChecking=no" -o "UserKnownHostsFile=/dev/null" -o "BatchMode=yes"'
         remote_tmpdir = f'/tmp/bulkdownloader_{run_number}_{os.getpid()}'
-        bulkdownloader_cmd = f'bulkdownloader -r {run_number} -c {shlex.quote(config_name)} -p {shlex.quote(remote_tmpdir)} -t {num_threads}'
-        remote_script = f'mkdir -p {shlex.quote(remote_tmpdir)}; {set_env_command}; {bulkdownloader_cmd}; cd {shlex.quote(remote_tmpdir)}; tar czf - .; cd /; rm -rf {shlex.quote(remote_tmpdir)}'
-        command_to_run = f'ssh {sshopts} {shlex.quote(remote_host)} {shlex.quote(remote_script)} | tar xzf - -C {shlex.quote(str(destination_dir))}'
+        remote_script = _remote_script(remote_tmpdir, _remote_env_command(archive_uri), f'bulkdownloader -r {run_number} -c {shlex.quote(config_name)} -p "$d" -t $(( $(nproc)/2 ))', 'cd "$d"', 'tar czf - .')
+        _run_pipeline('Bulkdownloader', [[*_ssh_command(remote_host), remote_script], ['tar', 'xzf', '-', '-C', str(destination_dir)]])
     else:
-        bulkdownloader_cmd = f'bulkdownloader -r {run_number} -c {shlex.quote(config_name)} -p {shlex.quote(str(destination_dir))} -t {num_threads}'
-        command_to_run = f'{set_env_command}; {bulkdownloader_cmd}'
-    try:
-        logger.debug('Executing bulkdownloader command: %s', command_to_run)
-        result = subprocess.run(command_to_run, shell=True, check=True, capture_output=True, text=True, timeout=300)
-        logger.debug('Bulkdownloader stdout:\n%s', result.stdout)
-        if result.stderr:
-            logger.warning('Bulkdownloader stderr:\n%s', result.stderr)
-    except subprocess.CalledProcessError as e:
-        error_message = f'Bulkdownloader failed with code {e.returncode}.\nCmd: {e.cmd}\nStdout: {e.stdout}\nStderr: {e.stderr}'
-        logger.error(error_message)
-        raise ArtdaqDBError(error_message) from e
-    except subprocess.TimeoutExpired as e:
-        error_message = f'Bulkdownloader timed out.\nStdout: {e.stdout}\nStderr: {e.stderr}'
-        logger.error(error_message)
-        raise ArtdaqDBError(error_message) from e
\ No newline at end of file
+        _run_pipeline('Bulkdownloader', [['bulkdownloader', '-r', str(run_number), '-c', config_name, '-p', str(destination_dir), '-t', _LOCAL_THREADS]], env={**os.environ, **_tool_environment(archive_uri)})
\ No newline at end of file
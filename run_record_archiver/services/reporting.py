@@ -1,42 +1,155 @@
+import functools
 import logging
+import queue
 import smtplib
 import socket
+import threading
 from datetime import datetime
 from email.message import EmailMessage
-from typing import List, Optional
-from ..config import ReportingConfig
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+from ..config import EmailConfig, ReportingConfig
+from ..constants import EMAIL_SMTP_TIMEOUT_SECONDS, REPORTING_FLUSH_TIMEOUT_SECONDS
 from ..exceptions import ReportingError
 try:
     from slack_bolt import App
     SLACK_AVAILABLE = True
 except ImportError:
     SLACK_AVAILABLE = False
+_HOSTNAME = socket.gethostname()
 
-def _send_slack_notification(failed_runs: List[int], config: ReportingConfig, stage: str) -> None:
+class _SmtpSession:
+    _sessions: Dict[Tuple[str, int, bool, Optional[str]], '_SmtpSession'] = {}
+    _sessions_lock = threading.Lock()
+
+    def __init__(self, config: EmailConfig):
+        self._config = config
+        self._server: Optional[smtplib.SMTP] = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def get(cls, config: EmailConfig) -> '_SmtpSession':
+        key = (config.smtp_host, config.smtp_port, config.smtp_use_tls, config.smtp_user)
+        with cls._sessions_lock:
+            session = cls._sessions.get(key)
+            if session is None:
+                session = cls._sessions[key] = cls(config)
+            return session
+
+    @classmethod
+    def close_all(cls) -> None:
+        with cls._sessions_lock:
+            (sessions, cls._sessions) = (list(cls._sessions.values()), {})
+        for session in sessions:
+            session.close()
+
+    def _connect(self) -> smtplib.SMTP:
+        logging.getLogger(__name__).info('Connecting to SMTP server %s:%d to send failure report.', self._config.smtp_host, self._config.smtp_port)
+        server = smtplib.SMTP(self._config.smtp_host, self._config.smtp_port, timeout=EMAIL_SMTP_TIMEOUT_SECONDS)
+        try:
+            if self._config.smtp_use_tls:
+                server.starttls()
+            if self._config.smtp_user and self._config.smtp_password:
+                server.login(self._config.smtp_user, self._config.smtp_password)
+        except BaseException:
+            server.close()
+            raise
+        return server
+
+    def _is_alive(self) -> bool:
+        try:
+            return self._server.noop()[0] == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    def send(self, msg: EmailMessage) -> None:
+        with self._lock:
+            if self._server is not None and (not self._is_alive()):
+                self._discard()
+            if self._server is None:
+                self._server = self._connect()
+            try:
+                self._server.send_message(msg)
+            except BaseException:
+                self._discard()
+                raise
+
+    def _discard(self) -> None:
+        try:
+            self._server.close()
+        finally:
+            self._server = None
+
+    def close(self) -> None:
+        with self._lock:
+            if self._server is None:
+                return
+            try:
+                self._server.quit()
+            except (smtplib.SMTPException, OSError):
+                pass
+            finally:
+                self._discard()
+
+class _NotifyWorker:
+
+    def __init__(self):
+        self._logger = logging.getLogger(__name__)
+        self._queue: 'queue.SimpleQueue[Callable[[], None]]' = queue.SimpleQueue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def submit(self, task: Callable[[], None]) -> None:
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='FailureReporter', daemon=True)
+                self._thread.start()
+        self._queue.put(task)
+
+    def _run(self) -> None:
+        while True:
+            task = self._queue.get()
+            try:
+                task()
+            except ReportingError:
+                pass
+            except Exception:
+                self._logger.exception('Unexpected error while sending failure report')
+
+    def flush(self, timeout: float) -> bool:
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                return True
+        done = threading.Event()
+        self._queue.put(done.set)
+        return done.wait(timeout)
+_notify_worker = _NotifyWorker()
+
+@functools.lru_cache(maxsize=4)
+def _get_slack_app(token: str) -> 'App':
+    return App(token=token)
+
+def _send_slack_notification(sorted_runs: List[int], config: ReportingConfig, stage: str, current_time: str) -> None:
     logger = logging.getLogger(__name__)
     if not config.slack.enabled:
         return
     if not SLACK_AVAILABLE:
         logger.warning('Slack notifications enabled but slack-bolt library not available')
         return
-    if not failed_runs:
+    if not sorted_runs:
         return
     try:
-        app = App(token=config.slack.bot_token)
-        hostname = socket.gethostname()
-        current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        run_count = len(failed_runs)
+        app = _get_slack_app(config.slack.bot_token)
+        run_count = len(sorted_runs)
         if run_count <= 10:
-            run_list = ', '.join(map(str, sorted(failed_runs)))
+            run_list = ', '.join(map(str, sorted_runs))
         else:
-            first_runs = sorted(failed_runs)[:10]
-            run_list = ', '.join(map(str, first_runs)) + f', ... ({run_count - 10} more)'
+            run_list = ', '.join(map(str, sorted_runs[:10])) + f', ... ({run_count - 10} more)'
         mentions = ''
         if config.slack.mention_users:
             user_ids = [uid.strip() for uid in config.slack.mention_users.split(',')]
             mentions = ' ' + ' '.join([f'<@{uid}>' for uid in user_ids if uid])
-        blocks = [{'type': 'header', 'text': {'type': 'plain_text', 'text': f'⚠️ Run Record Archiver {stage.capitalize()} Failures'}}, {'type': 'section', 'fields': [{'type': 'mrkdwn', 'text': f'*Host:*\n{hostname}'}, {'type': 'mrkdwn', 'text': f'*Time:*\n{current_time}'}, {'type': 'mrkdwn', 'text': f'*Stage:*\n{stage.capitalize()}'}, {'type': 'mrkdwn', 'text': f'*Failed Runs:*\n{run_count}'}]}, {'type': 'section', 'text': {'type': 'mrkdwn', 'text': f'*Run Numbers:*\n{run_list}'}}]
-        response = app.client.chat_postMessage(channel=config.slack.channel, text=f'Run Record Archiver {stage.capitalize()} Failures: {run_count} runs failed on {hostname}{mentions}', blocks=blocks)
+        blocks = [{'type': 'header', 'text': {'type': 'plain_text', 'text': f'⚠️ Run Record Archiver {stage.capitalize()} Failures'}}, {'type': 'section', 'fields': [{'type': 'mrkdwn', 'text': f'*Host:*\n{_HOSTNAME}'}, {'type': 'mrkdwn', 'text': f'*Time:*\n{current_time}'}, {'type': 'mrkdwn', 'text': f'*Stage:*\n{stage.capitalize()}'}, {'type': 'mrkdwn', 'text': f'*Failed Runs:*\n{run_count}'}]}, {'type': 'section', 'text': {'type': 'mrkdwn', 'text': f'*Run Numbers:*\n{run_list}'}}]
+        response = app.client.chat_postMessage(channel=config.slack.channel, text=f'Run Record Archiver {stage.capitalize()} Failures: {run_count} runs failed on {_HOSTNAME}{mentions}', blocks=blocks)
         if response['ok']:
             logger.info('Slack notification sent successfully to channel %s', config.slack.channel)
         else:
@@ -44,31 +157,32 @@ def _send_slack_notification(failed_runs: List[int], config: ReportingConfig, st
     except Exception as e:
         logger.error('Failed to send Slack notification: %s', e)
 
-def send_failure_report(failed_runs: List[int], config: ReportingConfig, stage: str) -> None:
-    logger = logging.getLogger(__name__)
-    if not failed_runs:
+def send_failure_report(failed_runs: Sequence[int], config: ReportingConfig, stage: str) -> None:
+    if not failed_runs or not (config.slack.enabled or config.email.enabled):
         return
-    _send_slack_notification(failed_runs, config, stage)
+    current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    _notify_worker.submit(functools.partial(_deliver_failure_report, sorted(failed_runs), config, stage, current_time))
+
+def _deliver_failure_report(sorted_runs: List[int], config: ReportingConfig, stage: str, current_time: str) -> None:
+    logger = logging.getLogger(__name__)
+    _send_slack_notification(sorted_runs, config, stage, current_time)
     if not config.email.enabled:
         return
     msg = EmailMessage()
-    hostname = socket.gethostname()
-    current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    subject = f'Run Record Archiver {stage.capitalize()} Errors on {hostname} at {current_time}'
-    body = f'The following runs failed during the {stage} stage:\n\n' + '\n'.join(map(str, sorted(failed_runs)))
+    subject = f'Run Record Archiver {stage.capitalize()} Errors on {_HOSTNAME} at {current_time}'
+    body = f'The following runs failed during the {stage} stage:\n\n' + '\n'.join(map(str, sorted_runs))
     msg.set_content(body)
     msg['Subject'] = subject
     msg['From'] = config.email.sender_email
     msg['To'] = config.email.recipient_email
     try:
-        logger.info('Connecting to SMTP server %s:%d to send failure report.', config.email.smtp_host, config.email.smtp_port)
-        with smtplib.SMTP(config.email.smtp_host, config.email.smtp_port, timeout=10) as server:
-            if config.email.smtp_use_tls:
-                server.starttls()
-            if config.email.smtp_user and config.email.smtp_password:
-                server.login(config.email.smtp_user, config.email.smtp_password)
-            server.send_message(msg)
-            logger.info('Failure report email sent successfully to %s.', config.email.recipient_email)
+        _SmtpSession.get(config.email).send(msg)
+        logger.info('Failure report email sent successfully to %s.', config.email.recipient_email)
     except (smtplib.SMTPException, socket.gaierror, TimeoutError) as e:
         logger.error('Failed to send failure report email: %s', e)
-        raise ReportingError('Failed to send failure report email') from e
\ No newline at end of file
+        raise ReportingError('Failed to send failure report email') from e
+
+def shutdown_reporting(timeout: float=REPORTING_FLUSH_TIMEOUT_SECONDS) -> None:
+    if not _notify_worker.flush(timeout):
+        logging.getLogger(__name__).warning('Failure reports still pending after %.0f seconds; abandoning them', timeout)
+    _SmtpSession.close_all()
\ No newline at end of file
@@ -1,22 +1,66 @@
 import logging
+import os
 import time
 from functools import wraps
-from typing import Any, Callable
+from pathlib import Path
+from typing import Any, Callable, Iterator, Sequence, Set
 
 def performance_monitor(func: Callable) -> Callable:
+    logger = logging.getLogger(func.__module__)
 
     @wraps(func)
     def wrapper(*args, **kwargs) -> Any:
-        logger = logging.getLogger(func.__module__)
+        carbon_client = getattr(args[0], 'carbon_client', None) if args else None
+        carbon_enabled = carbon_client is not None and carbon_client.enabled
+        debug = logger.isEnabledFor(logging.DEBUG)
+        if not (debug or carbon_enabled):
+            return func(*args, **kwargs)
         start_time = time.perf_counter()
         try:
             return func(*args, **kwargs)
         finally:
             duration_ms = (time.perf_counter() - start_time) * 1000
-            logger.debug('PERF: %s.%s executed in %.2f ms.', func.__module__, func.__name__, duration_ms)
-            if args and hasattr(args[0], 'carbon_client'):
-                carbon_client = args[0].carbon_client
-                if carbon_client and carbon_client.enabled:
-                    metric_path = f'{args[0].__class__.__name__}.{func.__name__}.duration_ms'
-                    carbon_client.post_metric(metric_path, duration_ms)
-    return wrapper
\ No newline at end of file
+            if debug:
+                logger.debug('PERF: %s.%s executed in %.2f ms.', func.__module__, func.__name__, duration_ms)
+            if carbon_enabled:
+                carbon_client.post_metric(f'{args[0].__class__.__name__}.{func.__name__}.duration_ms', duration_ms)
+    return wrapper
+
+def bounded_worker_count(configured_workers: int) -> int:
+    return max(1, min(configured_workers, max(4, 2 * (os.cpu_count() or 1))))
+
+def find_last_contiguous_run(sorted_runs: Sequence[int], start: int=0) -> int:
+    if start >= len(sorted_runs):
+        return 0
+    offset = sorted_runs[start] - start
+    (lo, hi) = (start, len(sorted_runs) - 1)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if sorted_runs[mid] - mid == offset:
+            lo = mid
+        else:
+            hi = mid - 1
+    return sorted_runs[lo]
+
+def scan_run_directories(run_records_dir: Path) -> Set[int]:
+    runs: Set[int] = set()
+    add = runs.add
+    with os.scandir(run_records_dir) as entries:
+        for entry in entries:
+            if entry.name.isdigit() and entry.is_dir():
+                add(int(entry.name))
+    return runs
+
+def scan_files_recursive(path: str) -> Iterator[os.DirEntry]:
+    try:
+        with os.scandir(path) as entries:
+            subdirs = []
+            for entry in entries:
+                if entry.is_file():
+                    yield entry
+                elif entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.path)
+    except PermissionError:
+        return
+    for subdir in subdirs:
+        yield from scan_files_recursive(subdir)
\ No newline at end of file
@@ -1,11 +1,15 @@
 from __future__ import annotations
 import argparse
+import contextlib
+import filecmp
 import logging
 import os
 import shutil
 import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import Dict, List, Optional, Set
+from typing import Any, Dict, List, Optional, Set
 PROJECT_ROOT = Path(__file__).parent.parent.parent
 sys.path.insert(0, str(PROJECT_ROOT))
 sys.path.insert(0, str(PROJECT_ROOT / 'tools'))
@@ -22,10 +26,19 @@ import urllib3
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
 logger = logging.getLogger(__name__)
+EXPORT_DONE_MARKER = '.done'
+_worker_comparator: Optional['ArtdaqDBUconDBComparator'] = None
+
+def _init_worker(comparator_args: Dict[str, Any]) -> None:
+    global _worker_comparator
+    _worker_comparator = ArtdaqDBUconDBComparator(**comparator_args)
+
+def _compare_one(run_number: int) -> Dict:
+    return _worker_comparator.compare_run(run_number)
 
 class ArtdaqDBUconDBComparator:
 
-    def __init__(self, config: Config, artdaqdb_output_dir: Path, ucondb_output_dir: Path, diff_options: Optional[DiffOptions]=None, use_fhicl_dump: bool=False, show_diff: bool=False, ignore_files: Optional[Set[str]]=None):
+    def __init__(self, config: Config, artdaqdb_output_dir: Path, ucondb_output_dir: Path, diff_options: Optional[DiffOptions]=None, use_fhicl_dump: bool=False, show_diff: bool=False, ignore_files: Optional[Set[str]]=None, keep: bool=False, resume: bool=False):
         self.config = config
         self.artdaqdb_output_dir = artdaqdb_output_dir
         self.ucondb_output_dir = ucondb_output_dir
@@ -33,6 +46,11 @@ class ArtdaqDBUconDBComparator:
         self.use_fhicl_dump = use_fhicl_dump
         self.show_diff = show_diff
         self.ignore_files = ignore_files or set()
+        self.resume = resume
+        self.keep = keep or resume
+        self._worker_args = {'config': config, 'artdaqdb_output_dir': artdaqdb_output_dir, 'ucondb_output_dir': ucondb_output_dir, 'diff_options': self.diff_options, 'use_fhicl_dump': use_fhicl_dump, 'show_diff': show_diff, 'ignore_files': self.ignore_files, 'keep': self.keep, 'resume': resume}
+        artdaqdb_output_dir.mkdir(parents=True, exist_ok=True)
+        ucondb_output_dir.mkdir(parents=True, exist_ok=True)
         logger.info(f'Initializing ArtdaqDB client: {config.artdaq_db.database_uri}')
         self.artdaqdb_client = ArtdaqDBClient(database_uri=config.artdaq_db.database_uri, use_tools=config.artdaq_db.use_tools, remote_host=config.artdaq_db.remote_host)
         logger.info(f'Initializing UconDB client: {config.ucon_db.server_url}')
@@ -40,68 +58,95 @@ class ArtdaqDBUconDBComparator:
         self.blob_creator = BlobCreator()
         self.results = {'matching': [], 'different': [], 'failed': [], 'missing_artdaqdb': [], 'missing_ucondb': []}
 
-    def export_from_artdaqdb(self, run_number: int) -> Path:
-        dest_dir = self.artdaqdb_output_dir / f'run_{run_number}'
+    def _kept_run_dir(self, base_dir: Path, run_number: int) -> Optional[Path]:
+        dest_dir = base_dir / f'run_{run_number}'
+        if self.resume and (dest_dir / EXPORT_DONE_MARKER).is_file():
+            return None
         if dest_dir.exists():
             shutil.rmtree(dest_dir)
         dest_dir.mkdir(parents=True, exist_ok=True)
+        return dest_dir
+
+    def export_from_artdaqdb(self, run_number: int, dest_dir: Optional[Path]=None) -> Path:
+        if dest_dir is None:
+            dest_dir = self._kept_run_dir(self.artdaqdb_output_dir, run_number)
+            if dest_dir is None:
+                logger.info(f'Reusing completed ArtdaqDB export of run {run_number}')
+                return self.artdaqdb_output_dir / f'run_{run_number}'
         logger.info(f'Exporting run {run_number} from ArtdaqDB')
         self.artdaqdb_client.export_run_configuration(run_number, dest_dir)
         logger.info(f'Exported run {run_number} from ArtdaqDB')
+        if self.keep:
+            (dest_dir / EXPORT_DONE_MARKER).touch()
         return dest_dir
 
-    def download_and_extract_ucondb(self, run_number: int) -> Path:
-        dest_dir = self.ucondb_output_dir / f'run_{run_number}'
-        if dest_dir.exists():
-            shutil.rmtree(dest_dir)
-        dest_dir.mkdir(parents=True, exist_ok=True)
+    def download_and_extract_ucondb(self, run_number: int, dest_dir: Optional[Path]=None) -> Path:
+        if dest_dir is None:
+            dest_dir = self._kept_run_dir(self.ucondb_output_dir, run_number)
+            if dest_dir is None:
+                logger.info(f'Reusing completed UconDB download of run {run_number}')
+                return self.ucondb_output_dir / f'run_{run_number}'
         logger.info(f'Downloading run {run_number} from UconDB')
         blob = self.ucondb_client.get_data(run_number)
         extracted_files = self.blob_creator.extract_files_from_blob(blob, dest_dir)
         logger.info(f'Extracted {len(extracted_files)} files from UconDB run {run_number}')
+        if self.keep:
+            (dest_dir / EXPORT_DONE_MARKER).touch()
         return dest_dir
 
+    def _scratch_dir(self, scratch: contextlib.ExitStack, base_dir: Path, run_number: int, tag: str) -> Optional[Path]:
+        if self.keep:
+            return None
+        return Path(scratch.enter_context(tempfile.TemporaryDirectory(prefix=f'run_{run_number}_{tag}_', dir=base_dir)))
+
     def should_ignore_file(self, filepath: str) -> bool:
         if not self.ignore_files:
             return False
-        basename = Path(filepath).stem
-        filename = Path(filepath).name
-        return basename in self.ignore_files or filename in self.ignore_files
+        filename = os.path.basename(filepath)
+        return filename in self.ignore_files or os.path.splitext(filename)[0] in self.ignore_files
 
     def compare_run(self, run_number: int) -> Dict:
         result = {'run_number': run_number, 'status': 'unknown', 'differences': [], 'missing_in_ucondb': [], 'extra_in_ucondb': [], 'error': None}
+        with contextlib.ExitStack() as scratch:
+            return self._compare_run(run_number, result, scratch)
+
+    def _compare_run(self, run_number: int, result: Dict, scratch: contextlib.ExitStack) -> Dict:
         try:
             try:
-                artdaqdb_dir = self.export_from_artdaqdb(run_number)
+                artdaqdb_dir = self.export_from_artdaqdb(run_number, self._scratch_dir(scratch, self.artdaqdb_output_dir, run_number, 'adq'))
             except Exception as e:
                 result['status'] = 'missing_artdaqdb'
                 result['error'] = str(e)
                 return result
             try:
-                ucondb_dir = self.download_and_extract_ucondb(run_number)
+                ucondb_dir = self.download_and_extract_ucondb(run_number, self._scratch_dir(scratch, self.ucondb_output_dir, run_number, 'ucon'))
             except Exception as e:
                 result['status'] = 'missing_ucondb'
                 result['error'] = str(e)
                 return result
             artdaqdb_files = get_fcl_files(artdaqdb_dir)
             ucondb_files = get_fcl_files(ucondb_dir)
-            if self.ignore_files:
-                artdaqdb_files = {k: v for (k, v) in artdaqdb_files.items() if not self.should_ignore_file(k)}
-                ucondb_files = {k: v for (k, v) in ucondb_files.items() if not self.should_ignore_file(k)}
-            artdaqdb_set = set(artdaqdb_files.keys())
-            ucondb_set = set(ucondb_files.keys())
-            missing_in_ucondb = artdaqdb_set - ucondb_set
-            extra_in_ucondb = ucondb_set - artdaqdb_set
-            common_files = artdaqdb_set & ucondb_set
+            (missing_in_ucondb, extra_in_ucondb, common_files) = ([], [], [])
+            for rel_path in artdaqdb_files:
+                if not self.should_ignore_file(rel_path):
+                    (common_files if rel_path in ucondb_files else missing_in_ucondb).append(rel_path)
+            for rel_path in ucondb_files:
+                if rel_path not in artdaqdb_files and (not self.should_ignore_file(rel_path)):
+                    extra_in_ucondb.append(rel_path)
             if missing_in_ucondb:
-                result['missing_in_ucondb'] = sorted(list(missing_in_ucondb))
+                missing_in_ucondb.sort()
+                result['missing_in_ucondb'] = missing_in_ucondb
             if extra_in_ucondb:
-                result['extra_in_ucondb'] = sorted(list(extra_in_ucondb))
-            for rel_path in sorted(common_files):
+                extra_in_ucondb.sort()
+                result['extra_in_ucondb'] = extra_in_ucondb
+            common_files.sort()
+            for rel_path in common_files:
                 artdaqdb_file = artdaqdb_files[rel_path]
                 ucondb_file = ucondb_files[rel_path]
+                if filecmp.cmp(artdaqdb_file, ucondb_file, shallow=False):
+                    continue
                 if self.use_fhicl_dump:
-                    (is_identical, diff) = compare_files_with_fhicl_dump(artdaqdb_file, ucondb_file, self.diff_options)
+                    (is_identical, diff) = compare_files_with_fhicl_dump(artdaqdb_file, ucondb_file)
                 else:
                     is_identical = files_are_identical(artdaqdb_file, ucondb_file, self.diff_options)
                     diff = None
@@ -117,34 +162,44 @@ class ArtdaqDBUconDBComparator:
             logger.error(f'Error comparing run {run_number}: {e}', exc_info=True)
         return result
 
-    def compare_range(self, start: int, end: int) -> None:
+    def compare_range(self, start: int, end: int, jobs: int=1) -> None:
         logger.info(f'Starting comparison for run range: {start} to {end}')
         total_runs = end - start + 1
-        for (i, run_number) in enumerate(range(start, end + 1), 1):
-            logger.info(f'[{i}/{total_runs}] Comparing run {run_number}...')
-            result = self.compare_run(run_number)
-            status = result['status']
-            if status == 'matching':
-                self.results['matching'].append(run_number)
-                logger.info(f'  ✓ Run {run_number}: Files match (100% migration success)')
-            elif status == 'different':
-                self.results['different'].append(result)
-                logger.error(f'  ✗ Run {run_number}: CRITICAL - Migration differences found!')
-                if result['missing_in_ucondb']:
-                    logger.error(f"    Missing in UconDB: {result['missing_in_ucondb']}")
-                if result['extra_in_ucondb']:
-                    logger.error(f"    Extra in UconDB: {result['extra_in_ucondb']}")
-                if result['differences']:
-                    logger.error(f"    Files with differences: {[d['file'] for d in result['differences']]}")
-            elif status == 'missing_artdaqdb':
-                self.results['missing_artdaqdb'].append(run_number)
-                logger.warning(f'  ⊘ Run {run_number}: Missing in ArtdaqDB')
-            elif status == 'missing_ucondb':
-                self.results['missing_ucondb'].append(run_number)
-                logger.warning(f'  ⊘ Run {run_number}: Missing in UconDB')
-            else:
-                self.results['failed'].append(result)
-                logger.error(f"  ✗ Run {run_number}: Failed - {result['error']}")
+        if jobs <= 1:
+            for (i, run_number) in enumerate(range(start, end + 1), 1):
+                logger.info(f'[{i}/{total_runs}] Comparing run {run_number}...')
+                self._record_result(self.compare_run(run_number))
+            return
+        logger.info(f'Comparing with {jobs} worker processes')
+        with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker, initargs=(self._worker_args,)) as executor:
+            for (i, result) in enumerate(executor.map(_compare_one, range(start, end + 1), chunksize=4), 1):
+                logger.info(f"[{i}/{total_runs}] Compared run {result['run_number']}")
+                self._record_result(result)
+
+    def _record_result(self, result: Dict) -> None:
+        run_number = result['run_number']
+        status = result['status']
+        if status == 'matching':
+            self.results['matching'].append(run_number)
+            logger.info(f'  ✓ Run {run_number}: Files match (100% migration success)')
+        elif status == 'different':
+            self.results['different'].append(result)
+            logger.error(f'  ✗ Run {run_number}: CRITICAL - Migration differences found!')
+            if result['missing_in_ucondb']:
+                logger.error(f"    Missing in UconDB: {result['missing_in_ucondb']}")
+            if result['extra_in_ucondb']:
+                logger.error(f"    Extra in UconDB: {result['extra_in_ucondb']}")
+            if result['differences']:
+                logger.error(f"    Files with differences: {[d['file'] for d in result['differences']]}")
+        elif status == 'missing_artdaqdb':
+            self.results['missing_artdaqdb'].append(run_number)
+            logger.warning(f'  ⊘ Run {run_number}: Missing in ArtdaqDB')
+        elif status == 'missing_ucondb':
+            self.results['missing_ucondb'].append(run_number)
+            logger.warning(f'  ⊘ Run {run_number}: Missing in UconDB')
+        else:
+            self.results['failed'].append(result)
+            logger.error(f"  ✗ Run {run_number}: Failed - {result['error']}")
 
     def print_summary(self) -> None:
         total = len(self.results['matching']) + len(self.results['different']) + len(self.results['failed'])
@@ -206,6 +261,9 @@ def main():
     parser.add_argument('--end', type=int, required=True, help='End run number (inclusive)')
     parser.add_argument('--artdaqdb-dir', type=Path, default=Path('/tmp/export_artdaqdb1'), help='Output directory for ArtdaqDB exports (default: /tmp/export_artdaqdb1)')
     parser.add_argument('--ucondb-dir', type=Path, default=Path('/tmp/export_ucondb2'), help='Output directory for UconDB files (default: /tmp/export_ucondb2)')
+    parser.add_argument('-j', '--jobs', type=int, default=1, help='Number of runs to compare in parallel worker processes (default: 1)')
+    parser.add_argument('--keep', action='store_true', help='Keep exported files in run_<N> directories under the output directories (default: per-run temporary directories removed after comparison)')
+    parser.add_argument('--resume', action='store_true', help='Reuse completed run_<N> exports from a previous --keep run instead of exporting again (implies --keep)')
     parser.add_argument('-v', '--verbose', action='store_true', help='Enable verbose (DEBUG) logging')
     parser.add_argument('--show-diff', action='store_true', help='Show detailed diffs for differences')
     parser.add_argument('--with-fhicl-dump', action='store_true', help='Use fhicl-dump to normalize files before comparison')
@@ -236,9 +294,9 @@ def main():
                 ignore_files.add(filename)
                 if not filename.endswith('.fcl'):
                     ignore_files.add(f'{filename}.fcl')
-    comparator = ArtdaqDBUconDBComparator(config=config, artdaqdb_output_dir=args.artdaqdb_dir, ucondb_output_dir=args.ucondb_dir, diff_options=diff_options, use_fhicl_dump=args.with_fhicl_dump, show_diff=args.show_diff, ignore_files=ignore_files)
+    comparator = ArtdaqDBUconDBComparator(config=config, artdaqdb_output_dir=args.artdaqdb_dir, ucondb_output_dir=args.ucondb_dir, diff_options=diff_options, use_fhicl_dump=args.with_fhicl_dump, show_diff=args.show_diff, ignore_files=ignore_files, keep=args.keep, resume=args.resume)
     try:
-        comparator.compare_range(args.start, args.end)
+        comparator.compare_range(args.start, args.end, jobs=args.jobs)
     except KeyboardInterrupt:
         logger.warning('\nComparison interrupted by user')
         sys.exit(130)
@@ -1,14 +1,47 @@
+import contextlib
 import difflib
 import hashlib
+import itertools
 import logging
+import mmap
 import os
 import re
+import shutil
 import subprocess
 import tempfile
-from dataclasses import dataclass
+import threading
+from dataclasses import dataclass, field
+from functools import lru_cache, partial
+from operator import methodcaller
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple
+from typing import Callable, Dict, Iterator, List, Optional, Pattern, Tuple
+try:
+    from blake3 import blake3
+    BLAKE3_AVAILABLE = True
+except ImportError:
+    BLAKE3_AVAILABLE = False
 logger = logging.getLogger(__name__)
+_HASH_CHUNK_BYTES = 1 << 20
+_SPACE_CHANGE_RE = re.compile('[ \\t]+')
+_LINE_BREAKING_SPACE = '\x0b\x0c\r\x1c\x1d\x1e\x1f'
+_DELETE_SPACE = str.maketrans('', '', ' \t')
+_BLANK_LINES = frozenset(('', '\n', '\r', '\r\n'))
+_EXTERNAL_DIFF_MIN_LINES = 2000
+_EXTERNAL_DIFF_TIMEOUT_SECONDS = 30
+_DIFF_CONTEXT_LINES = 3
+_FHICL_DUMP_TIMEOUT_SECONDS = 30
+_FHICL_DUMP_PREAMBLE = (b'# Produced from', b'#   Input')
+_LIB_DIR = Path(__file__).parent.parent.parent / 'lib'
+_FHICL_DUMP_BIN = shutil.which('fhicl-dump', path=os.pathsep.join((str(_LIB_DIR), os.environ.get('PATH', ''))))
+_FHICL_DUMP_ENV = {**os.environ, 'LD_LIBRARY_PATH': ':'.join(filter(None, (str(_LIB_DIR), os.environ.get('LD_LIBRARY_PATH', ''))))} if _LIB_DIR.exists() else dict(os.environ)
+_FHICL_DUMP_CACHE_MAX_ENTRIES = 4096
+_FHICL_DUMP_DIGESTS: Dict[str, str] = {}
+
+def _delete_all_space(line: str) -> str:
+    return ''.join(line.split()) + '\n' if line.endswith('\n') else ''.join(line.split())
+
+def _strip_trailing_space(line: str) -> str:
+    return line.rstrip() + '\n' if line.endswith('\n') else line.rstrip()
 
 @dataclass
 class DiffOptions:
@@ -19,68 +52,209 @@ class DiffOptions:
     ignore_all_space: bool = False
     ignore_blank_lines: bool = False
     ignore_matching_lines: Optional[str] = None
+    _ignore_matching_re: Optional[Pattern[str]] = field(default=None, init=False, repr=False, compare=False)
+    _line_steps: Tuple[Callable[[str], str], ...] = field(default=(), init=False, repr=False, compare=False)
+
+    def __post_init__(self) -> None:
+        if self.ignore_matching_lines:
+            self._ignore_matching_re = re.compile(self.ignore_matching_lines)
+        steps = []
+        if self.ignore_all_space:
+            steps.append(_delete_all_space)
+        elif self.ignore_space_change:
+            steps.append(partial(_SPACE_CHANGE_RE.sub, ' '))
+        if self.ignore_tab_expansion:
+            steps.append(methodcaller('expandtabs', 8))
+        if self.ignore_trailing_space:
+            steps.append(_strip_trailing_space)
+        if self.ignore_case:
+            steps.append(str.lower)
+        self._line_steps = tuple(steps)
+
+def _new_hasher():
+    return blake3() if BLAKE3_AVAILABLE else hashlib.blake2b(digest_size=16)
 
 def compute_file_hash(file_path: Path) -> str:
-    return hashlib.md5(file_path.read_bytes()).hexdigest()
+    hasher = _new_hasher()
+    with file_path.open('rb', buffering=0) as f:
+        size = os.fstat(f.fileno()).st_size
+        if size:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped, memoryview(mapped) as view:
+                for offset in range(0, size, _HASH_CHUNK_BYTES):
+                    hasher.update(view[offset:offset + _HASH_CHUNK_BYTES])
+    return hasher.hexdigest()
 
 def normalize_line(line: str, options: DiffOptions) -> str:
+    for step in options._line_steps:
+        line = step(line)
+    return line
+
+def normalize_text(text: str, options: DiffOptions) -> str:
     if options.ignore_all_space:
-        had_newline = line.endswith('\n')
-        line = ''.join(line.split())
-        if had_newline:
-            line += '\n'
+        text = text.translate(_DELETE_SPACE)
     elif options.ignore_space_change:
-        line = re.sub('[ \\t]+', ' ', line)
+        text = _SPACE_CHANGE_RE.sub(' ', text)
     if options.ignore_tab_expansion:
-        line = line.expandtabs(8)
+        text = text.expandtabs(8)
     if options.ignore_trailing_space:
-        line = line.rstrip() + ('\n' if line.endswith('\n') else '')
+        text = '\n'.join([line.rstrip(' \t') for line in text.split('\n')])
     if options.ignore_case:
-        line = line.lower()
-    return line
+        text = text.lower()
+    return text
 
 def should_ignore_line(line: str, options: DiffOptions) -> bool:
     line_stripped = line.rstrip('\n\r')
     if options.ignore_blank_lines and (not line_stripped):
         return True
-    if options.ignore_matching_lines and re.search(options.ignore_matching_lines, line):
+    if options._ignore_matching_re is not None and options._ignore_matching_re.search(line):
         return True
     return False
 
+def _normalize_lines(lines: List[str], options: DiffOptions) -> List[str]:
+    if not (options.ignore_blank_lines or options._line_steps):
+        if options._ignore_matching_re is not None:
+            return list(itertools.filterfalse(options._ignore_matching_re.search, lines))
+        return lines
+    text = ''.join(lines)
+    plain = text.isascii() and (not any((c in text for c in _LINE_BREAKING_SPACE)))
+    filtered = False
+    if options.ignore_blank_lines and (not plain or '\n\n' in text or text.startswith('\n')):
+        lines = list(itertools.filterfalse(_BLANK_LINES.__contains__, lines))
+        filtered = True
+    if options._ignore_matching_re is not None:
+        lines = list(itertools.filterfalse(options._ignore_matching_re.search, lines))
+        filtered = True
+    if options._line_steps:
+        if not plain:
+            for step in options._line_steps:
+                lines = list(map(step, lines))
+            return lines
+        if filtered:
+            text = ''.join(lines)
+        normalized = normalize_text(text, options).splitlines(keepends=True)
+        if len(normalized) < len(lines):
+            normalized.append('')
+        return normalized
+    return lines
+
+def _read_if_exists(path: Path) -> Optional[bytes]:
+    try:
+        return path.read_bytes()
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+
+def _split_lines(raw: bytes) -> List[str]:
+    text = raw.decode('utf-8')
+    if '\r' in text:
+        text = text.replace('\r\n', '\n').replace('\r', '\n')
+    return text.splitlines(keepends=True)
+
+def _identical_under(lines1: List[str], lines2: List[str], options: DiffOptions) -> bool:
+    if len(lines1) != len(lines2) and (not (options.ignore_blank_lines or options.ignore_matching_lines)):
+        return False
+    return _normalize_lines(lines1, options) == _normalize_lines(lines2, options)
+
+def _external_unified_diff(lines1: List[str], lines2: List[str], filename: str) -> Optional[str]:
+    with tempfile.TemporaryDirectory(prefix='generate_diff_') as tmpdir:
+        (path1, path2) = (os.path.join(tmpdir, 'a'), os.path.join(tmpdir, 'b'))
+        for (path, lines) in ((path1, lines1), (path2, lines2)):
+            with open(path, 'w', encoding='utf-8', newline='') as f:
+                f.writelines(lines)
+        try:
+            result = subprocess.run(['diff', '-u', '--label', f'a/{filename}', '--label', f'b/{filename}', path1, path2], capture_output=True, text=True, encoding='utf-8', errors='replace', timeout=_EXTERNAL_DIFF_TIMEOUT_SECONDS)
+        except (OSError, subprocess.TimeoutExpired) as e:
+            logger.debug('External diff unavailable for %s, falling back to difflib: %s', filename, e)
+            return None
+    if result.returncode not in (0, 1):
+        logger.debug('External diff failed for %s, falling back to difflib: %s', filename, result.stderr.strip())
+        return None
+    return result.stdout
+
+def _common_affixes(a: List[str], b: List[str]) -> Tuple[int, int]:
+    limit = min(len(a), len(b))
+    prefix = 0
+    while prefix < limit and a[prefix] == b[prefix]:
+        prefix += 1
+    suffix = 0
+    while suffix < limit - prefix and a[-1 - suffix] == b[-1 - suffix]:
+        suffix += 1
+    return (prefix, suffix)
+
+class _AffixTrimmingMatcher(difflib.SequenceMatcher):
+
+    def __init__(self, a: List[str], b: List[str]):
+        (prefix, suffix) = _common_affixes(a, b)
+        (self._prefix, self._full_a, self._full_b) = (prefix, len(a), len(b))
+        super().__init__(None, a[prefix:len(a) - suffix], b[prefix:len(b) - suffix])
+
+    def get_opcodes(self) -> List[Tuple[str, int, int, int, int]]:
+        p = self._prefix
+        codes = [('equal', 0, p, 0, p)] if p else []
+        for (tag, i1, i2, j1, j2) in super().get_opcodes():
+            if tag == 'equal' and codes and codes[-1][0] == 'equal':
+                codes[-1] = ('equal', codes[-1][1], i2 + p, codes[-1][3], j2 + p)
+            else:
+                codes.append((tag, i1 + p, i2 + p, j1 + p, j2 + p))
+        (i, j) = (codes[-1][2], codes[-1][4]) if codes else (0, 0)
+        if i < self._full_a:
+            if codes and codes[-1][0] == 'equal':
+                codes[-1] = ('equal', codes[-1][1], self._full_a, codes[-1][3], self._full_b)
+            else:
+                codes.append(('equal', i, self._full_a, j, self._full_b))
+        return codes
+
+def _format_range(start: int, stop: int) -> str:
+    length = stop - start
+    if length == 1:
+        return str(start + 1)
+    return f'{start + 1 if length else start},{length}'
+
+def _unified_diff(lines1: List[str], lines2: List[str], filename: str) -> List[str]:
+    diff_lines: List[str] = []
+    for group in _AffixTrimmingMatcher(lines1, lines2).get_grouped_opcodes(_DIFF_CONTEXT_LINES):
+        if not diff_lines:
+            diff_lines += [f'--- a/{filename}', f'+++ b/{filename}']
+        diff_lines.append(f'@@ -{_format_range(group[0][1], group[-1][2])} +{_format_range(group[0][3], group[-1][4])} @@')
+        for (tag, i1, i2, j1, j2) in group:
+            if tag == 'equal':
+                diff_lines += [' ' + line for line in lines1[i1:i2]]
+                continue
+            diff_lines += ['-' + line for line in lines1[i1:i2]]
+            diff_lines += ['+' + line for line in lines2[j1:j2]]
+    return diff_lines
+
 def generate_diff(file1: Path, file2: Path, filename: str, options: Optional[DiffOptions]=None) -> str:
     if options is None:
         options = DiffOptions()
     try:
-        lines1 = file1.read_text(encoding='utf-8').splitlines(keepends=True)
-        lines2 = file2.read_text(encoding='utf-8').splitlines(keepends=True)
+        lines1 = _split_lines(file1.read_bytes())
+        lines2 = _split_lines(file2.read_bytes())
     except UnicodeDecodeError:
         return f'{filename}: Binary files differ\n'
-    if options.ignore_blank_lines or options.ignore_matching_lines:
-        lines1 = [l for l in lines1 if not should_ignore_line(l, options)]
-        lines2 = [l for l in lines2 if not should_ignore_line(l, options)]
-    if any([options.ignore_case, options.ignore_tab_expansion, options.ignore_trailing_space, options.ignore_space_change, options.ignore_all_space]):
-        lines1 = [normalize_line(l, options) for l in lines1]
-        lines2 = [normalize_line(l, options) for l in lines2]
-    diff_lines = list(difflib.unified_diff(lines1, lines2, fromfile=f'a/{filename}', tofile=f'b/{filename}', lineterm=''))
+    lines1 = _normalize_lines(lines1, options)
+    lines2 = _normalize_lines(lines2, options)
+    if max(len(lines1), len(lines2)) > _EXTERNAL_DIFF_MIN_LINES:
+        diff_text = _external_unified_diff(lines1, lines2, filename)
+        if diff_text is not None:
+            return diff_text or f'{filename}: Files are identical (but hashes differ?)\n'
+    diff_lines = _unified_diff(lines1, lines2, filename)
     if not diff_lines:
         return f'{filename}: Files are identical (but hashes differ?)\n'
-    return '\n'.join(diff_lines) + '\n'
+    return '\n'.join((line.rstrip('\n') for line in diff_lines)) + '\n'
 
 def files_are_identical(file1: Path, file2: Path, options: Optional[DiffOptions]=None) -> bool:
     if options is None:
         options = DiffOptions()
+    raw1 = file1.read_bytes()
+    raw2 = file2.read_bytes()
+    if raw1 == raw2:
+        return True
     try:
-        lines1 = file1.read_text(encoding='utf-8').splitlines(keepends=True)
-        lines2 = file2.read_text(encoding='utf-8').splitlines(keepends=True)
+        lines1 = _split_lines(raw1)
+        lines2 = _split_lines(raw2)
     except UnicodeDecodeError:
-        return file1.read_bytes() == file2.read_bytes()
-    if options.ignore_blank_lines or options.ignore_matching_lines:
-        lines1 = [l for l in lines1 if not should_ignore_line(l, options)]
-        lines2 = [l for l in lines2 if not should_ignore_line(l, options)]
-    if any([options.ignore_case, options.ignore_tab_expansion, options.ignore_trailing_space, options.ignore_space_change, options.ignore_all_space]):
-        lines1 = [normalize_line(l, options) for l in lines1]
-        lines2 = [normalize_line(l, options) for l in lines2]
-    return lines1 == lines2
+        return False
+    return _identical_under(lines1, lines2, options)
 
 class DiffAnalyzer:
     FLAG_CONFIGS = {'ignore-case': DiffOptions(ignore_case=True), 'ignore-tab-expansion': DiffOptions(ignore_tab_expansion=True), 'ignore-trailing-space': DiffOptions(ignore_trailing_space=True), 'ignore-space-change': DiffOptions(ignore_space_change=True), 'ignore-all-space': DiffOptions(ignore_all_space=True), 'ignore-blank-lines': DiffOptions(ignore_blank_lines=True)}
@@ -89,23 +263,30 @@ class DiffAnalyzer:
 
     @classmethod
     def analyze_difference(cls, file1: Path, file2: Path, ignore_matching_pattern: Optional[str]=None) -> Tuple[str, List[str]]:
-        exists1 = file1.exists()
-        exists2 = file2.exists()
-        if not exists1 and (not exists2):
+        raw1 = _read_if_exists(file1)
+        raw2 = _read_if_exists(file2)
+        if raw1 is None and raw2 is None:
             return ('missing', [])
-        if not exists1:
+        if raw1 is None:
             return ('only2', [])
-        if not exists2:
+        if raw2 is None:
             return ('only1', [])
-        if files_are_identical(file1, file2):
+        if raw1 == raw2:
+            return ('identical', [])
+        try:
+            lines1 = _split_lines(raw1)
+            lines2 = _split_lines(raw2)
+        except UnicodeDecodeError:
+            return ('different', [])
+        if lines1 == lines2:
             return ('identical', [])
-        applicable_flags = []
-        for (flag_name, flag_option) in cls.FLAG_CONFIGS.items():
-            if files_are_identical(file1, file2, flag_option):
-                applicable_flags.append(flag_name)
+        (prefix, suffix) = _common_affixes(lines1, lines2)
+        lines1 = lines1[prefix:len(lines1) - suffix]
+        lines2 = lines2[prefix:len(lines2) - suffix]
+        applicable_flags = [flag_name for (flag_name, flag_option) in cls.FLAG_CONFIGS.items() if _identical_under(lines1, lines2, flag_option)]
         if ignore_matching_pattern:
             opts = DiffOptions(ignore_matching_lines=ignore_matching_pattern)
-            if files_are_identical(file1, file2, opts):
+            if _identical_under(lines1, lines2, opts):
                 applicable_flags.append(f'ignore-matching-lines={ignore_matching_pattern}')
         if not applicable_flags:
             return ('different', [])
@@ -157,39 +338,27 @@ class DiffAnalyzer:
             max_status_len = max(max_status_len, len('STATUS'))
         status_width = max_status_len + 2
         header = f"{'FILE':<{path_width}} {'STATUS':<{status_width}} APPLICABLE FLAGS"
+        sep_line = '=' * len(header)
+        row_fmt = f'{{:<{path_width}}} {{:<{status_width}}} {{}}'.format
         lines.append(header)
-        lines.append('=' * len(header))
+        lines.append(sep_line)
         status_order = {'only1': 0, 'only2': 1, 'different': 2, 'multiple': 3, 'identical': 4}
         sorted_files = sorted(file_statuses.items(), key=lambda x: (status_order.get(x[1][0], 99), x[0]))
+        if use_emoji:
+            names = {status for (status, _) in file_statuses.values()}
+            names.update(itertools.chain.from_iterable((flags for (status, flags) in file_statuses.values() if status == 'multiple')))
+            display = {name: '#' if name.startswith('ignore-matching-lines') else cls.STATUS_EMOJIS.get(name, name) for name in names}
         for (path, (status, flags)) in sorted_files:
             display_path = path if len(path) <= path_width else '...' + path[-(path_width - 3):]
-            if use_emoji:
-                display_status = cls.STATUS_EMOJIS.get(status, status)
-                if status.startswith('ignore-matching-lines'):
-                    display_status = '#'
-            else:
-                display_status = status
+            display_status = display[status] if use_emoji else status
             if status in ('only1', 'only2', 'identical', 'different'):
-                lines.append(f'{display_path:<{path_width}} {display_status:<{status_width}} -')
+                flags_str = '-'
             elif status == 'multiple':
-                if use_emoji:
-                    flag_emojis = []
-                    for flag in flags:
-                        if flag.startswith('ignore-matching-lines'):
-                            flag_emojis.append('#')
-                        else:
-                            flag_emojis.append(cls.STATUS_EMOJIS.get(flag, flag))
-                    flags_str = ', '.join(flag_emojis)
-                else:
-                    flags_str = ', '.join(flags)
-                lines.append(f'{display_path:<{path_width}} {display_status:<{status_width}} {flags_str}')
+                flags_str = ', '.join(map(display.__getitem__, flags) if use_emoji else flags)
             else:
-                if use_emoji:
-                    flags_str = display_status
-                else:
-                    flags_str = status
-                lines.append(f'{display_path:<{path_width}} {display_status:<{status_width}} {flags_str}')
-        lines.append('=' * len(header))
+                flags_str = display_status
+            lines.append(row_fmt(display_path, display_status, flags_str))
+        lines.append(sep_line)
         status_counts = {}
         for (status, _) in file_statuses.values():
             status_counts[status] = status_counts.get(status, 0) + 1
@@ -209,36 +378,29 @@ class DiffAnalyzer:
 
 def get_fcl_files(run_dir: Path) -> Dict[str, Path]:
     fcl_files = {}
-    for fcl_file in run_dir.rglob('*.fcl'):
-        filename = fcl_file.name
-        fcl_files[filename] = fcl_file
+    stack = [str(run_dir)]
+    while stack:
+        subdirs = []
+        try:
+            with os.scandir(stack.pop()) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.path)
+                    elif entry.name.endswith('.fcl') and entry.is_file():
+                        fcl_files[entry.name] = Path(entry.path)
+        except PermissionError:
+            continue
+        stack.extend(reversed(subdirs))
     return fcl_files
 
+def _fhicl_dump_env(fcl_file: Path, fhicl_file_path: Optional[Path]) -> Dict[str, str]:
+    return {**_FHICL_DUMP_ENV, 'FHICL_FILE_PATH': str(fhicl_file_path if fhicl_file_path is not None else fcl_file.parent)}
+
 def run_fhicl_dump(fcl_file: Path, fhicl_file_path: Optional[Path]=None) -> Tuple[bool, str]:
-    project_root = Path(__file__).parent.parent.parent
-    fhicl_dump_bin = project_root / 'lib' / 'fhicl-dump'
-    if not fhicl_dump_bin.exists():
-        try:
-            result = subprocess.run(['which', 'fhicl-dump'], capture_output=True, text=True, timeout=5)
-            if result.returncode == 0:
-                fhicl_dump_bin = Path(result.stdout.strip())
-            else:
-                return (False, 'fhicl-dump binary not found')
-        except Exception as e:
-            return (False, f'Failed to locate fhicl-dump: {e}')
-    env = os.environ.copy()
-    lib_dir = project_root / 'lib'
-    if lib_dir.exists():
-        ld_library_path = env.get('LD_LIBRARY_PATH', '')
-        if ld_library_path:
-            env['LD_LIBRARY_PATH'] = f'{lib_dir}:{ld_library_path}'
-        else:
-            env['LD_LIBRARY_PATH'] = str(lib_dir)
-    if fhicl_file_path is None:
-        fhicl_file_path = fcl_file.parent
-    env['FHICL_FILE_PATH'] = str(fhicl_file_path)
+    if _FHICL_DUMP_BIN is None:
+        return (False, 'fhicl-dump binary not found')
     try:
-        result = subprocess.run([str(fhicl_dump_bin), '-c', str(fcl_file)], capture_output=True, text=True, env=env, timeout=30)
+        result = subprocess.run([_FHICL_DUMP_BIN, '-c', str(fcl_file)], capture_output=True, text=True, env=_fhicl_dump_env(fcl_file, fhicl_file_path), timeout=_FHICL_DUMP_TIMEOUT_SECONDS)
         if result.returncode == 0:
             return (True, result.stdout)
         else:
@@ -248,55 +410,117 @@ def run_fhicl_dump(fcl_file: Path, fhicl_file_path: Optional[Path]=None) -> Tupl
     except Exception as e:
         return (False, f'fhicl-dump error: {e}')
 
+def _dump_lines(process: subprocess.Popen) -> Iterator[bytes]:
+    return (line for line in process.stdout if not line.startswith(_FHICL_DUMP_PREAMBLE))
+
+@lru_cache(maxsize=None)
+def _fhicl_dump_fingerprint() -> bytes:
+    paths = [_FHICL_DUMP_BIN]
+    if _LIB_DIR.is_dir():
+        paths.extend(sorted((entry.path for entry in os.scandir(_LIB_DIR))))
+    hasher = _new_hasher()
+    for path in paths:
+        st = os.stat(path)
+        hasher.update(f'{os.path.realpath(path)}:{st.st_mtime_ns}:{st.st_size}\0'.encode())
+    return hasher.digest()
+
+def _dump_cache_key(fcl_file: Path) -> Optional[str]:
+    content = fcl_file.read_bytes()
+    if b'#include' in content:
+        return None
+    hasher = _new_hasher()
+    hasher.update(_fhicl_dump_fingerprint())
+    hasher.update(content)
+    return hasher.hexdigest()
+
+def _store_dump_digest(key: Optional[str], digest: str) -> None:
+    if key is None:
+        return
+    if len(_FHICL_DUMP_DIGESTS) >= _FHICL_DUMP_CACHE_MAX_ENTRIES:
+        del _FHICL_DUMP_DIGESTS[next(iter(_FHICL_DUMP_DIGESTS))]
+    _FHICL_DUMP_DIGESTS[key] = digest
+
+def _dump_digests(fcl_files: List[Path], fhicl_file_path: Optional[Path]) -> Tuple[Optional[List[str]], Optional[str]]:
+    processes: List[subprocess.Popen] = []
+    expired: List[subprocess.Popen] = []
+
+    def expire() -> None:
+        expired.extend((process for process in processes if process.poll() is None))
+        for process in expired:
+            process.kill()
+    with contextlib.ExitStack() as stack:
+        stderrs = [stack.enter_context(tempfile.TemporaryFile()) for _ in fcl_files]
+        watchdog = threading.Timer(_FHICL_DUMP_TIMEOUT_SECONDS, expire)
+        try:
+            for (fcl_file, stderr) in zip(fcl_files, stderrs):
+                try:
+                    processes.append(subprocess.Popen([_FHICL_DUMP_BIN, '-c', str(fcl_file)], stdout=subprocess.PIPE, stderr=stderr, env=_fhicl_dump_env(fcl_file, fhicl_file_path)))
+                except OSError as e:
+                    return (None, f'Failed to process {fcl_file.name}: fhicl-dump error: {e}')
+            watchdog.start()
+            hashers = [_new_hasher() for _ in fcl_files]
+            for lines in itertools.zip_longest(*map(_dump_lines, processes)):
+                for (hasher, line) in zip(hashers, lines):
+                    if line is not None:
+                        hasher.update(line)
+            for process in processes:
+                process.wait()
+        finally:
+            watchdog.cancel()
+            for process in processes:
+                if process.poll() is None:
+                    process.kill()
+                    process.wait()
+                process.stdout.close()
+        for (fcl_file, process, stderr) in zip(fcl_files, processes, stderrs):
+            if process in expired:
+                return (None, f'Failed to process {fcl_file.name}: fhicl-dump timeout')
+            if process.returncode != 0:
+                stderr.seek(0)
+                return (None, f"Failed to process {fcl_file.name}: fhicl-dump failed: {stderr.read().decode('utf-8', 'replace')}")
+    return ([hasher.hexdigest() for hasher in hashers], None)
+
 def compare_files_with_fhicl_dump(file1: Path, file2: Path, fhicl_file_path: Optional[Path]=None) -> Tuple[bool, Optional[str]]:
-    (success1, output1) = run_fhicl_dump(file1, fhicl_file_path)
-    if not success1:
-        return (False, f'Failed to process {file1.name}: {output1}')
-    (success2, output2) = run_fhicl_dump(file2, fhicl_file_path)
-    if not success2:
-        return (False, f'Failed to process {file2.name}: {output2}')
-    lines1 = [l for l in output1.splitlines() if not l.startswith('# Produced from') and (not l.startswith('#   Input'))]
-    lines2 = [l for l in output2.splitlines() if not l.startswith('# Produced from') and (not l.startswith('#   Input'))]
-    if lines1 == lines2:
-        return (True, None)
-    else:
-        return (False, None)
+    if _FHICL_DUMP_BIN is None:
+        return (False, f'Failed to process {file1.name}: fhicl-dump binary not found')
+    files = (file1, file2)
+    keys = []
+    for fcl_file in files:
+        try:
+            keys.append(_dump_cache_key(fcl_file))
+        except OSError as e:
+            return (False, f'Failed to process {fcl_file.name}: {e}')
+    digests = [_FHICL_DUMP_DIGESTS.get(key) if key is not None else None for key in keys]
+    pending = [index for (index, digest) in enumerate(digests) if digest is None]
+    if pending:
+        (computed, failure) = _dump_digests([files[index] for index in pending], fhicl_file_path)
+        if computed is None:
+            return (False, failure)
+        for (index, digest) in zip(pending, computed):
+            digests[index] = digest
+            _store_dump_digest(keys[index], digest)
+    return (digests[0] == digests[1], None)
 
 def print_comparison_summary(results: Dict[str, any], instance1_name: str='Instance 1', instance2_name: str='Instance 2') -> None:
-    logger.info('=' * 80)
-    logger.info('Comparison Summary')
-    logger.info('=' * 80)
+    rule = '=' * 80
     identical = len(results['identical_runs'])
     different = len(results['different_runs'])
     failed = len(results['failed_runs'])
     total = identical + different + failed
-    logger.info('Total runs compared: %d', total)
-    logger.info('Identical runs: %d (%.1f%%)', identical, 100 * identical / total if total > 0 else 0)
-    logger.info('Different runs: %d (%.1f%%)', different, 100 * different / total if total > 0 else 0)
-    logger.info('Failed runs: %d (%.1f%%)', failed, 100 * failed / total if total > 0 else 0)
+    lines = [rule, 'Comparison Summary', rule, 'Total runs compared: %d' % total, 'Identical runs: %d (%.1f%%)' % (identical, 100 * identical / total if total > 0 else 0), 'Different runs: %d (%.1f%%)' % (different, 100 * different / total if total > 0 else 0), 'Failed runs: %d (%.1f%%)' % (failed, 100 * failed / total if total > 0 else 0)]
     only_in_1 = results.get('only_in_db1', results.get('only_in_instance1', []))
     only_in_2 = results.get('only_in_db2', results.get('only_in_instance2', []))
     if only_in_1:
-        logger.info('')
-        logger.info('Runs only in %s: %d', instance1_name, len(only_in_1))
-        logger.info('  %s', only_in_1)
+        lines.extend(('', 'Runs only in %s: %d' % (instance1_name, len(only_in_1)), '  %s' % (only_in_1,)))
     if only_in_2:
-        logger.info('')
-        logger.info('Runs only in %s: %d', instance2_name, len(only_in_2))
-        logger.info('  %s', only_in_2)
+        lines.extend(('', 'Runs only in %s: %d' % (instance2_name, len(only_in_2)), '  %s' % (only_in_2,)))
     if results['different_runs']:
-        logger.info('')
-        logger.info('Runs with differences:')
+        lines.extend(('', 'Runs with differences:'))
         for (run_number, diffs) in sorted(results['different_runs'].items()):
-            logger.info('  Run %d:', run_number)
-            for diff in diffs:
-                if '\n' in diff:
-                    logger.info('    %s', diff.replace('\n', '\n    '))
-                else:
-                    logger.info('    - %s', diff)
+            lines.append('  Run %d:' % run_number)
+            lines.extend(('    ' + diff.replace('\n', '\n    ') if '\n' in diff else '    - ' + diff for diff in diffs))
     if results['failed_runs']:
-        logger.info('')
-        logger.info('Failed runs:')
-        for (run_number, error) in sorted(results['failed_runs'].items()):
-            logger.info('  Run %d: %s', run_number, error)
-    logger.info('=' * 80)
\ No newline at end of file
+        lines.extend(('', 'Failed runs:'))
+        lines.extend(('  Run %d: %s' % (run_number, error) for (run_number, error) in sorted(results['failed_runs'].items())))
+    lines.append(rule)
+    logger.info('\n%s', '\n'.join(lines))
\ No newline at end of file